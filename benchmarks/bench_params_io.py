@@ -0,0 +1,31 @@
+"""
+benchmark of the per-point overhead of serializing and rebuilding CAMBparams, which get_cls pays whenever it
+saves a run (save_to_dict) and whenever it checks the transfer-function or spectra caches
+
+usage (from the top-level directory): python -m benchmarks.bench_params_io
+"""
+
+import timeit
+from deepcmbsim.params_io import config_obj, _camb_params_to_dict, camb_params_from_dict
+
+
+def bench_params_io(number=500):
+    """
+    Returns
+    -------
+    dict
+        mean time per call in microseconds of the full serializer, of config_obj.camb_params_to_dict (the
+        serializer plus the diff against base_config.yaml), and of the loader
+    """
+    co = config_obj()
+    cpd = _camb_params_to_dict(co.CAMBparams)
+    return {
+        'camb_params_to_dict_full_us': timeit.timeit(lambda: _camb_params_to_dict(co.CAMBparams), number=number) / number * 1e6,
+        'camb_params_to_dict_user_us': timeit.timeit(lambda: co.camb_params_to_dict(user_params=True), number=number) / number * 1e6,
+        'camb_params_from_dict_us': timeit.timeit(lambda: camb_params_from_dict(cpd), number=number) / number * 1e6,
+    }
+
+
+if __name__ == '__main__':
+    for k, v in bench_params_io().items():
+        print(f"{k}: {v:.1f}")
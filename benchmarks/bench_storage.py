@@ -0,0 +1,95 @@
+"""
+benchmark of the write throughput, read throughput and file size of the STORAGE settings (dtype and compression)
+with which savecls and sweep_io.SweepWriter store power spectra
+
+usage (from the top-level directory): python -m benchmarks.bench_storage
+"""
+
+import os
+import tempfile
+import time
+import numpy as np
+from deepcmbsim.params_io import config_obj
+from deepcmbsim.camb_power_spectrum import CAMBPowerSpectrum
+from deepcmbsim.sweep_io import SweepDataset, read_run
+
+STORAGE_OPTIONS = {
+    'f8': {'dtype': 'f8'},
+    'f8,gzip,shuffle': {'dtype': 'f8', 'compression': 'gzip', 'shuffle': True},
+    'f4': {'dtype': 'f4'},
+    'f4,gzip,shuffle': {'dtype': 'f4', 'compression': 'gzip', 'shuffle': True},
+    'f4,lzf,shuffle': {'dtype': 'f4', 'compression': 'lzf', 'shuffle': True},
+}
+
+
+def _power_spectrum(max_l_use, n_runs, seed=0):
+    """
+    CAMBPowerSpectrum holding n_runs runs, which are one CAMB calculation rescaled by random amplitudes so that,
+    like a real sweep, every run differs in every digit
+    """
+    co = config_obj()
+    for k, v in [("verbose", False), ("max_l_use", max_l_use), ("max_eta_k", 2.5 * (max_l_use + 300)),
+                 ("max_eta_k_tensor", 2.5 * (max_l_use + 300))]:
+        co.update_val(k, v, verbose=False)
+    ps = CAMBPowerSpectrum(co)
+    cls = ps.get_cls()
+    rng = np.random.default_rng(seed)
+    for i in range(n_runs):
+        run_id = f'run{i}'
+        ps.results[run_id] = {k: v if k == 'l' else v * rng.uniform(0.8, 1.2) for k, v in cls.items()}
+        ps.result_parameters[run_id] = ps.camb_params_to_dict(user_params=True)
+        ps.swept_params[run_id] = {'Alens': float(i)}
+        ps.loop_runids.append(run_id)
+    ps.UserParams['ITERABLES'] = {'Alens': [0.]}
+    return ps
+
+
+def _directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, x)) for x in os.listdir(path)) if os.path.isdir(path) \
+        else os.path.getsize(path)
+
+
+def _result(n_runs, write_s, read_s, size_bytes):
+    return {'min_s': write_s / n_runs, 'write_runs_per_s': n_runs / write_s, 'read_runs_per_s': n_runs / read_s,
+            'size_mb': size_bytes / 1024**2, 'runs': n_runs}
+
+
+def bench_storage(max_l_use=2000, n_runs=200):
+    """
+    Returns
+    -------
+    dict
+        for each storage option and for each of savecls (one file per run, with l shared) and save_sweep (one
+        file), the write and read throughput in runs per second and the size on disk in MB, with the write time
+        per run as min_s so that benchmarks/compare.py can compare it between commits
+    """
+    ps = _power_spectrum(max_l_use, n_runs)
+    out = {}
+    for name, storage in STORAGE_OPTIONS.items():
+        ps.UserParams['STORAGE'] = {**storage, 'shared_l': True}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            savedir, sweep_path = os.path.join(tmpdir, 'runs'), os.path.join(tmpdir, 'sweep.h5')
+            start = time.perf_counter()
+            ps.savecls(savedir=savedir)
+            write_s = time.perf_counter() - start
+            start = time.perf_counter()
+            for run_id in ps.loop_runids:
+                read_run(savedir, run_id)
+            read_s = time.perf_counter() - start
+            out[f'savecls[{name}]'] = _result(n_runs, write_s, read_s, _directory_bytes(savedir))
+
+            start = time.perf_counter()
+            ps.save_sweep(sweep_path)
+            write_s = time.perf_counter() - start
+            start = time.perf_counter()
+            with SweepDataset(sweep_path) as dataset:
+                for _ in dataset.iter_batches(64, shuffle=False):
+                    pass
+            read_s = time.perf_counter() - start
+            out[f'save_sweep[{name}]'] = _result(n_runs, write_s, read_s, _directory_bytes(sweep_path))
+    return out
+
+
+if __name__ == '__main__':
+    for name, result in bench_storage().items():
+        print(name, {k: f"{v:.3g}" for k, v in result.items() if k != 'min_s'})
@@ -0,0 +1,64 @@
+"""
+compares two json files written by benchmarks/run_benchmarks.py, e.g. from two commits, and reports the ratio
+of the minimum times of every benchmark that appears in both
+
+usage (from the top-level directory):
+    python -m benchmarks.compare baseline.json new.json --threshold 1.2
+exits with status 1 if any benchmark is slower than the baseline by more than the threshold
+"""
+
+import argparse
+import json
+import sys
+
+
+def _min_times(results):
+    """
+    flattens the results of run_benchmarks into {name: seconds}, using the minimum time of each benchmark
+    (the params_io entries are already single numbers, in microseconds)
+    """
+    out = {}
+    for name, timings in results['results'].items():
+        if 'min_s' in timings:
+            out[name] = timings['min_s']
+        else:
+            out.update({f'{name}.{k}': v * 1e-6 for k, v in timings.items()})
+    return out
+
+
+def compare(baseline, new, threshold=1.2):
+    """
+    Parameters
+    ----------
+    baseline, new : dict
+        outputs of run_benchmarks
+    threshold : float, default 1.2
+        ratio new/baseline above which a benchmark counts as a regression
+
+    Returns
+    -------
+    list of tuple
+        (name, baseline seconds, new seconds, ratio, regressed) for every benchmark in both
+    """
+    base_times, new_times = _min_times(baseline), _min_times(new)
+    rows = []
+    for name in base_times:
+        if name in new_times:
+            ratio = new_times[name] / base_times[name]
+            rows.append((name, base_times[name], new_times[name], ratio, ratio > threshold))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+    with open(args.baseline) as f_base, open(args.new) as f_new:
+        baseline, new = json.load(f_base), json.load(f_new)
+    print(f"baseline {baseline.get('commit')} vs new {new.get('commit')}")
+    rows = compare(baseline, new, threshold=args.threshold)
+    for name, t_base, t_new, ratio, regressed in rows:
+        print(f"{name:60s} {t_base:10.4g} s {t_new:10.4g} s {ratio:6.2f}x{'  REGRESSION' if regressed else ''}")
+    sys.exit(1 if any(row[4] for row in rows) else 0)
@@ -0,0 +1,179 @@
+"""
+benchmark suite for the spectrum generation pipeline. Every benchmark uses a small CAMB configuration, so the
+suite runs offline on a CPU-only machine in a few minutes; results are written as json so that they can be
+compared between commits with benchmarks/compare.py
+
+usage (from the top-level directory):
+    python -m benchmarks.run_benchmarks --output bench_results.json
+    python -m benchmarks.run_benchmarks --quick  # fewer settings and repeats, e.g. for CI
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime as dt
+
+import numpy as np
+
+from deepcmbsim.params_io import config_obj
+from deepcmbsim.camb_power_spectrum import CAMBPowerSpectrum
+from benchmarks.bench_params_io import bench_params_io
+from benchmarks.bench_storage import bench_storage
+
+
+def _timings(func, repeats, number=1):
+    """
+    Returns
+    -------
+    dict
+        minimum, mean and standard deviation in seconds of `repeats` timings of `number` calls of func
+    """
+    times = np.array(timeit.repeat(func, repeat=repeats, number=number)) / number
+    return {'min_s': float(times.min()), 'mean_s': float(times.mean()), 'std_s': float(times.std()),
+            'repeats': repeats, 'number': number}
+
+
+def _small_config(max_l_use=200, accuracy_boost=1.0, noise_type="detector-white"):
+    """
+    config_obj for a small, fast CAMB calculation; max_eta_k is scaled with the multipole range as CAMB
+    recommends, rather than left at the value for max_l=10500 in base_config.yaml
+    """
+    co = config_obj()
+    for k, v in [("verbose", False), ("max_l_use", max_l_use), ("noise_type", noise_type),
+                 ("max_eta_k", 2.5 * (max_l_use + 300)), ("max_eta_k_tensor", 2.5 * (max_l_use + 300)),
+                 ("reuse_transfers", False)]:
+        co.update_val(k, v, verbose=False)
+    co.CAMBparams.Accuracy.AccuracyBoost = accuracy_boost
+    return co
+
+
+def bench_config_obj(repeats):
+    return {'config_obj': _timings(config_obj, repeats, number=5)}
+
+
+def bench_startup(repeats):
+    """
+    time taken by a new python process to import the package and to make its configuration, as seen by e.g. each
+    worker process of a sweep; the time of `python -c pass` is subtracted
+    """
+    statements = {'import deepcmbsim': 'import deepcmbsim',
+                  'import deepcmbsim.noise': 'import deepcmbsim.noise',
+                  'config_obj()': 'from deepcmbsim import config_obj; config_obj()'}
+
+    def run(statement):
+        subprocess.run([sys.executable, '-c', statement], check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+
+    baseline = _timings(lambda: run('pass'), repeats)['min_s']
+    out = {}
+    for name, statement in statements.items():
+        timings = _timings(lambda: run(statement), repeats)
+        timings['interpreter_s'] = baseline
+        timings.update({k: timings[k] - baseline for k in ['min_s', 'mean_s']})
+        out[f'startup[{name}]'] = timings
+    return out
+
+
+def bench_get_cls(repeats, max_l_uses, accuracy_boosts):
+    out = {}
+    for max_l_use in max_l_uses:
+        for accuracy_boost in accuracy_boosts:
+            ps = CAMBPowerSpectrum(_small_config(max_l_use=max_l_use, accuracy_boost=accuracy_boost))
+            ps.get_cls()  # warm up CAMB's cached tables so that every repeat does the same work
+            out[f'get_cls[max_l_use={max_l_use},AccuracyBoost={accuracy_boost}]'] = _timings(ps.get_cls, repeats)
+    return out
+
+
+def bench_get_noise(repeats):
+    co = _small_config()
+    co.update_val("max_l_use", 10000, verbose=False)
+    ps = CAMBPowerSpectrum(co)
+    return {'get_noise[max_l_use=10000]': _timings(ps.get_noise, repeats, number=20)}
+
+
+def bench_savecls(repeats, n_runs=20):
+    ps = CAMBPowerSpectrum(_small_config(max_l_use=2000))
+    cls = ps.get_cls()
+    for i in range(n_runs):
+        ps.results[f'run{i}'], ps.result_parameters[f'run{i}'] = cls, ps.camb_params_to_dict(user_params=True)
+        ps.loop_runids.append(f'run{i}')
+    with tempfile.TemporaryDirectory() as savedir:
+        timings = _timings(lambda: ps.savecls(savedir=savedir), repeats)
+    timings['runs_per_call'] = n_runs
+    return {f'savecls[max_l_use=2000,n_runs={n_runs}]': timings}
+
+
+def bench_flatmap(repeats, pixels=192, degrees=5):
+    from deepcmbsim.cl_plotting import flatmap, nmt
+    backend = 'namaster' if nmt is not None else 'flatsky'
+    ells = 10001
+    cl_dict = {k: np.abs(np.random.default_rng(0).normal(size=ells)) for k in ['clTT', 'clEE', 'clBB', 'clTE']}
+    fm = flatmap(pixels, degrees, cl_dict=cl_dict)
+    n_realizations = 32
+    batch = _timings(lambda: fm.flatmaps('TQU', n_realizations=n_realizations, seed=0, processes=os.cpu_count()), repeats)
+    batch['realizations_per_call'] = n_realizations
+    return {f'flatmap[{backend},TQU,pixels={pixels}]': _timings(lambda: fm.flatmap('TQU'), repeats),
+            f'flatmaps[{backend},TQU,pixels={pixels},n_realizations={n_realizations}]': batch}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(quick=False):
+    """
+    runs every benchmark
+
+    Parameters
+    ----------
+    quick : bool, default False
+        use fewer settings and repeats
+
+    Returns
+    -------
+    dict
+        metadata about the machine and the commit, and the timings of every benchmark
+    """
+    import camb
+    repeats = 2 if quick else 5
+    results = {}
+    results.update(bench_startup(repeats))
+    results.update(bench_config_obj(repeats))
+    results.update(bench_get_cls(repeats, max_l_uses=[200] if quick else [200, 1000, 2500],
+                                 accuracy_boosts=[1.0] if quick else [1.0, 2.0]))
+    results.update(bench_get_noise(repeats))
+    results.update(bench_savecls(repeats))
+    results.update(bench_flatmap(repeats))
+    results.update(bench_storage(n_runs=50 if quick else 200))
+    results['params_io'] = bench_params_io(number=100 if quick else 500)
+    return {
+        'commit': _git_commit(),
+        'date': dt.now().isoformat(),
+        'machine': {'platform': platform.platform(), 'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+                    'python': platform.python_version(), 'numpy': np.__version__, 'camb': camb.__version__},
+        'quick': quick,
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='bench_results.json', help='path of the json file of results')
+    parser.add_argument('--quick', action='store_true', help='fewer settings and repeats')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    out = run_benchmarks(quick=args.quick)
+    with open(args.output, 'w') as f:
+        json.dump(out, f, indent=2)
+    for name, timings in out['results'].items():
+        print(name, {k: (f"{v:.3g}" if isinstance(v, float) else v) for k, v in timings.items()})
+    print(f"wrote {args.output} in {time.perf_counter() - start:.0f} seconds")
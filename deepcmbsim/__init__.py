@@ -1,11 +1,34 @@
 """
 code for delensing the CMB and extracting r and Alens even in the presence of systematics
+
+the public classes are imported when they are first used, so that e.g. `from deepcmbsim import noise` or
+`deepcmbsim.sweep_io` does not import CAMB
 """
 
-from deepcmbsim.params_io import config_obj
-from deepcmbsim.camb_power_spectrum import CAMBPowerSpectrum
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    'config_obj': 'deepcmbsim.params_io',
+    'CAMBPowerSpectrum': 'deepcmbsim.camb_power_spectrum',
+    'flatmap': 'deepcmbsim.cl_plotting',
+}
+
+_SUBMODULES = ['augment', 'binning', 'cache', 'camb_power_spectrum', 'cl_plotting', 'emulator', 'flatsky',
+               'map_pipeline', 'noise', 'params_io', 'presets', 'sampling', 'sweep_io', 'timing']
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module(f"deepcmbsim.{name}")
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value  # so that __getattr__ is only called once for each name
+    return value
+
 
-try:
-    from deepcmbsim.cl_plotting import flatmap
-except ModuleNotFoundError:
-    pass
\ No newline at end of file
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES) + _SUBMODULES)
@@ -0,0 +1,126 @@
+"""
+data augmentation of noiseless power spectra at load time, so that a single sweep of CAMB calculations (run with
+`add_noise: False` in user_config.yaml) yields any number of noisy variants for training
+"""
+
+import numpy as np
+from deepcmbsim import noise
+
+
+class NoiseAugmentation:
+    """
+    streaming transform that adds detector white noise (see noise.detector_white_noise_batch) to batches of
+    noiseless power spectra, with the noise level and the beam drawn independently for every sample
+
+    Attributes
+    ----------
+    spectra : list of str
+        names of the power spectra in each batch, e.g. SweepDataset.spectra
+    l : np.ndarray
+        multipoles of the power spectra, e.g. SweepDataset.l
+    binning : binning.Binning or None
+        binning of band powers, e.g. SweepDataset.binning, with which the noise is binned like the spectra
+    noise_uKarcmin, beamfwhm_arcmin : float, tuple, or callable
+        distributions of the noise level in microKelvin*arcminutes and of the beam full width at half maximum
+        in arcminutes: a float is used for every sample, a tuple (low, high) is sampled uniformly, and a
+        callable is called as f(rng, n) and returns n samples
+    rng : np.random.Generator
+        random number generator from which the noise parameters are drawn
+    """
+    def __init__(self, spectra, l, noise_uKarcmin, beamfwhm_arcmin, seed=None, binning=None):
+        """
+        Parameters
+        ----------
+        spectra : list of str
+            names of the power spectra in each batch
+        l : array_like
+            multipoles of the power spectra
+        noise_uKarcmin : float, tuple, or callable
+            distribution of the noise level in microKelvin*arcminutes
+        beamfwhm_arcmin : float, tuple, or callable
+            distribution of the beam full width at half maximum in arcminutes
+        seed : int, optional
+            seed of the random number generator
+        binning : binning.Binning, optional
+            binning with which the spectra were turned into band powers (whose mean multipoles are l); required
+            for band powers, since the noise has to be computed at the multipoles that were binned
+        """
+        self.spectra = list(spectra)
+        self.l = np.asarray(l)
+        self.binning = binning
+        if binning is not None:
+            if len(binning.l_eff) != len(self.l):
+                raise ValueError(f"binning has {len(binning.l_eff)} bins, but there are {len(self.l)} multipoles l")
+        elif not np.array_equal(self.l, np.round(self.l)):
+            raise ValueError("l holds non-integer multipoles, as band powers do; pass the binning with which they "
+                             "were made, e.g. SweepDataset.binning")
+        self.noise_uKarcmin = noise_uKarcmin
+        self.beamfwhm_arcmin = beamfwhm_arcmin
+        self.rng = np.random.default_rng(seed)
+        # index of the noise (0 for temperature, 1 for polarization) added to each spectrum; None for no noise
+        self._fields = [{'clTT': 0, 'clEE': 1, 'clBB': 1, 'clTE': 1}.get(k) for k in self.spectra]
+
+    def _draw(self, distribution, n):
+        if callable(distribution):
+            return np.asarray(distribution(self.rng, n), dtype=float)
+        if isinstance(distribution, tuple):
+            return self.rng.uniform(distribution[0], distribution[1], size=n)
+        return np.full(n, float(distribution))
+
+    def param_names(self, param_names):
+        """
+        Parameters
+        ----------
+        param_names : list of str
+            names of the parameters of the noiseless batches, e.g. SweepDataset.param_names
+
+        Returns
+        -------
+        list of str
+            names of the parameters of the augmented batches
+        """
+        return list(param_names) + ['noise_uKarcmin', 'beamfwhm_arcmin']
+
+    def __call__(self, params, cls):
+        """
+        Parameters
+        ----------
+        params : np.ndarray
+            (n, n_params) array of parameters
+        cls : np.ndarray
+            (n, n_spectra, n_l) array of noiseless power spectra, e.g. as returned by indexing SweepDataset
+
+        Returns
+        -------
+        tuple
+            (params, cls) where the drawn noise level and beam of each sample are appended to its parameters
+            (see param_names) and the noise is added to a copy of cls
+        """
+        n = len(cls)
+        noise_uKarcmin, beamfwhm_arcmin = self._draw(self.noise_uKarcmin, n), self._draw(self.beamfwhm_arcmin, n)
+        # noise only at the stored multipoles, or binned like the band powers; (n, 2, n_l)
+        l = (self.binning.l if self.binning is not None else self.l).astype(int)
+        instrument_noise = noise.detector_white_noise_batch(noise_uKarcmin, beamfwhm_arcmin, l.max(),
+                                                            cache=False)[:, :, l]
+        if self.binning is not None:
+            instrument_noise = self.binning(instrument_noise)
+        noisy = np.array(cls, dtype=float)
+        for i, field in enumerate(self._fields):
+            if field is not None:
+                noisy[:, i] += instrument_noise[:, field]
+        return np.column_stack([params, noise_uKarcmin, beamfwhm_arcmin]), noisy
+
+    def transform(self, batches):
+        """
+        Parameters
+        ----------
+        batches : iterable
+            of (params, cls) tuples, e.g. SweepDataset.iter_batches
+
+        Returns
+        -------
+        iterator
+            yields the augmented (params, cls) of every batch
+        """
+        for params, cls in batches:
+            yield self(params, cls)
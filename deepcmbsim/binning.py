@@ -0,0 +1,126 @@
+"""
+binning of power spectra into band powers, which are much smaller to store and to train on than the spectra at
+every multipole
+"""
+
+import numpy as np
+
+
+def linear_edges(l_min, l_max, n_bins):
+    """
+    Returns
+    -------
+    np.ndarray
+        n_bins+1 (or fewer, if some would coincide) integer bin edges spaced linearly from l_min to l_max
+    """
+    return np.unique(np.round(np.linspace(l_min, l_max, n_bins + 1)).astype(int))
+
+
+def log_edges(l_min, l_max, n_bins):
+    """
+    Returns
+    -------
+    np.ndarray
+        n_bins+1 (or fewer, if some would coincide at low multipoles) integer bin edges spaced logarithmically
+        from l_min to l_max
+    """
+    return np.unique(np.round(np.geomspace(max(l_min, 1), l_max, n_bins + 1)).astype(int))
+
+
+class Binning:
+    """
+    precomputed binning operator, which turns power spectra of shape (..., n_l) into band powers of shape
+    (..., n_bins) with one matrix multiplication, so that it can be applied to every run of a sweep at once
+
+    Attributes
+    ----------
+    edges : np.ndarray
+        bin edges; bin i holds the multipoles edges[i] <= l < edges[i+1]
+    l : np.ndarray
+        multipoles of the power spectra that are binned
+    ell_factor : bool
+        whether the band powers are averages of l(l+1)Cl/2π rather than of Cl
+    matrix : np.ndarray
+        (n_bins, n_l) binning matrix
+    l_eff : np.ndarray
+        mean multipole of each bin
+    """
+    def __init__(self, edges, l, ell_factor=False):
+        """
+        Parameters
+        ----------
+        edges : array_like
+            increasing bin edges; bin i holds the multipoles edges[i] <= l < edges[i+1]
+        l : array_like
+            multipoles of the power spectra that will be binned, e.g. the 'l' of the output of get_cls
+        ell_factor : bool, default False
+            whether to average l(l+1)Cl/2π rather than Cl
+        """
+        self.edges, self.l, self.ell_factor = np.asarray(edges), np.asarray(l), ell_factor
+        members = (self.l[None, :] >= self.edges[:-1, None]) & (self.l[None, :] < self.edges[1:, None])
+        counts = members.sum(axis=1)
+        if np.any(counts == 0):
+            raise ValueError(f"bins {np.flatnonzero(counts == 0).tolist()} contain none of the multipoles l")
+        self.matrix = members / counts[:, None]
+        self.l_eff = self.matrix @ self.l
+        if ell_factor:
+            self.matrix = self.matrix * (self.l * (self.l + 1) / (2 * np.pi))
+
+    @classmethod
+    def from_config(cls, binning, l):
+        """
+        Parameters
+        ----------
+        binning : dict or None
+            as in UserParams['BINNING'], with `scheme` (None, 'linear', 'log' or 'custom'), `n_bins`, `l_min`,
+            `edges` (for 'custom') and `ell_factor`
+        l : array_like
+            multipoles of the power spectra that will be binned; the last bin ends at the largest of them
+
+        Returns
+        -------
+        Binning or None
+            None if binning is None or its scheme is None
+        """
+        scheme = (binning or {}).get('scheme')
+        if scheme is None:
+            return None
+        l = np.asarray(l)
+        l_min, l_max = int(binning.get('l_min', 2)), int(l.max()) + 1
+        if scheme == 'linear':
+            edges = linear_edges(l_min, l_max, int(binning['n_bins']))
+        elif scheme == 'log':
+            edges = log_edges(l_min, l_max, int(binning['n_bins']))
+        elif scheme == 'custom':
+            edges = binning['edges']
+        else:
+            raise ValueError(f"BINNING scheme must be None, 'linear', 'log' or 'custom', not {scheme}")
+        return cls(edges, l, ell_factor=bool(binning.get('ell_factor', False)))
+
+    def __call__(self, cls):
+        """
+        Parameters
+        ----------
+        cls : array_like
+            power spectra of shape (..., n_l), e.g. (n_runs, n_l) for every run of a sweep
+
+        Returns
+        -------
+        np.ndarray
+            band powers of shape (..., n_bins)
+        """
+        return np.asarray(cls) @ self.matrix.T
+
+    def bin_dict(self, cls_dict):
+        """
+        Parameters
+        ----------
+        cls_dict : dict
+            output of CAMBPowerSpectrum.get_cls
+
+        Returns
+        -------
+        dict
+            the same dictionary with the band powers of every spectrum, and l_eff as 'l'
+        """
+        return {k: self.l_eff if k == 'l' else self(v) for k, v in cls_dict.items()}
@@ -0,0 +1,126 @@
+"""
+content-addressed on-disk cache of noiseless power spectra, so that a cosmology that has already been computed
+(in this session or an earlier one) does not need to be passed to CAMB again
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+
+
+class SpectraCache:
+    """
+    cache of power spectra stored as one `.npz` file per set of effective parameters, with a cap on the
+    total size of the cache; when the cap is exceeded the least recently used entries are deleted
+
+    Attributes
+    ----------
+    cache_dir : str
+        directory in which the cached spectra are stored
+    max_bytes : int
+        maximum total size of the files in cache_dir
+    hits, misses : int
+        number of lookups in this session that did and did not find a cached entry
+    """
+    def __init__(self, cache_dir, max_mb=1000):
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            directory in which the cached spectra are stored; created if it does not exist
+        max_mb : float, default 1000
+            maximum total size of the cache in megabytes
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024**2)
+        self.hits, self.misses = 0, 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(*effective_params):
+        """
+        canonical hash of everything that determines the output of a CAMB calculation
+
+        Parameters
+        ----------
+        *effective_params
+            json-serializable objects, e.g. the full dictionary of CAMBparams, the maximum multipole,
+            and the list of requested spectra. Dictionaries are hashed independently of their ordering
+
+        Returns
+        -------
+        str
+            hexadecimal sha1 digest
+        """
+        canonical = json.dumps(effective_params, sort_keys=True, default=lambda x: np.asarray(x).tolist())
+        return hashlib.sha1(canonical.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """
+        Parameters
+        ----------
+        key : str
+            output of SpectraCache.key
+
+        Returns
+        -------
+        dict or None
+            the cached dictionary of power spectra, or None if there is no entry for key
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as f:
+                cls = {k: f[k] for k in f.files}
+        except (FileNotFoundError, OSError, ValueError):  # missing, or evicted/truncated by another process
+            self.misses += 1
+            return None
+        os.utime(path)  # mark as recently used
+        self.hits += 1
+        return cls
+
+    def put(self, key, cls):
+        """
+        stores a dictionary of power spectra and then evicts the least recently used entries if the
+        cache has grown beyond max_bytes
+
+        Parameters
+        ----------
+        key : str
+            output of SpectraCache.key
+        cls : dict
+            dictionary of power spectra
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **cls)
+        os.replace(tmp_path, path)  # never leave a partially written entry under a valid name
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(x[1] for x in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        deletes every entry of the cache
+        """
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npz"):
+                os.remove(entry.path)
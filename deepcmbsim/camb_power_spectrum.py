@@ -1,18 +1,44 @@
+import copy
 import itertools
 import camb
 import numpy as np
 from datetime import datetime as dt
-from deepcmbsim import noise
+from deepcmbsim import noise, presets, sampling, sweep_io
+from deepcmbsim.binning import Binning
+from deepcmbsim.cache import SpectraCache
+from deepcmbsim.timing import StageTimer, _maxrss_bytes
+from deepcmbsim.params_io import config_obj, _set_camb_attr
 import h5py
+import hashlib
 import json
 from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import os
+import time
 
 """
 Code to create an array of power spectra from CAMB based on a yaml file.
 Requires a config_obj instance.
 """
 
+# InitPower attributes that only enter the tensor power spectrum; changing them (or Alens) leaves the transfer
+# functions unchanged. The scalar attributes are added to these when the lensing is linear, because
+# power_spectra_from_transfer does not recalculate the non-linear lensing correction
+_TENSOR_INITPOWER = ['r', 'At', 'nt', 'ntrun', 'pivot_tensor']
+_SCALAR_INITPOWER = ['As', 'ns', 'nrun', 'nrunrun', 'pivot_scalar']
+
+# UserParams from which the multipole range of the calculation is planned (see CAMBPowerSpectrum._plan_multipoles)
+_PLAN_KEYS = ['max_l_use', 'beamfwhm_arcmin', 'noise_type', 'noise_uKarcmin', 'extra_l', 'accuracy_preset',
+              'L_SAMPLING', 'BINNING']
+
+# UserParams that only change how or where runs are computed and stored, but not the checkpointed spectra, and so
+# are left out of the run IDs of loop_sims(checkpoint_dir=...); checkpoints are never binned nor stored at reduced
+# precision, and FORCAMB is already part of the CAMBparams
+_EXECUTION_KEYS = ['FORCAMB', 'ITERABLES', 'SAMPLER', 'BINNING', 'STORAGE', 'namaster_seed', 'verbose', 'outfile_dir',
+                   'processes', 'keep_results', 'writer_queue_size', 'shard_index', 'shard_count', 'reuse_transfers',
+                   'cache_dir', 'cache_max_mb', 'trace_memory']
+
 
 class CAMBPowerSpectrum:
     """
@@ -25,8 +51,10 @@ class CAMBPowerSpectrum:
         ----------
         in_config_obj: config_obj instance
             Object that posesses a CAMBparams instance, a UserParams dict, a camb_params_to_dict method,
-            and an update_val method
+            and an update_val method. To use loop_sims with more than one process, it must also possess
+            the user_config, base_config and updates attributes of params_io.config_obj
         """
+        self._config_obj = in_config_obj
         self.camb_params_to_dict = lambda user_params: in_config_obj.camb_params_to_dict(user_params=user_params)
 
         self.CAMBparams = in_config_obj.CAMBparams
@@ -34,22 +62,126 @@ class CAMBPowerSpectrum:
 
         self.update_val = lambda k, v: in_config_obj.update_val(k, v, verbose = self.UserParams["verbose"])
 
-        # according to the CAMB documentation, errors affect the last "100 or so" multipoles
-        self.max_l_use = min(self.UserParams['max_l_use'], noise.max_multipole(self.UserParams['beamfwhm_arcmin']))
-        self.max_l_calc = int(self.max_l_use + self.UserParams['extra_l'])
-        self.CAMBparams.max_l = self.max_l_calc
-        self.CAMBparams.max_l_tensor = self.max_l_calc
-        # could make this^ its own function so that it gets recalculated even when you update params
+        # multipole range of the calculation, which is planned again whenever one of _PLAN_KEYS changes (e.g. by
+        # update_val during loop_sims), so that every point is only computed as far in l as it needs; _unplanned
+        # holds the values of the CAMBparams that the plan overrides, which are restored when it no longer does
+        self._plan_inputs = None
+        self._unplanned = {}
+        self._plan_multipoles()
 
         self._outdir = self.UserParams['outfile_dir']
 
         self.normalize_cls = bool(self.UserParams['normalize_cls'])
         self.TT_units = self.UserParams['TT_units']
 
+        # transfer functions of the last CAMB calculation, reused while only InitPower or Alens change
+        self.reuse_transfers = bool(self.UserParams.get('reuse_transfers', True))
+        self._transfers, self._transfers_signature = None, None
+
+        # optional on-disk cache of noiseless spectra, shared between sessions
+        if self.UserParams.get('cache_dir') is not None:
+            self.cache = SpectraCache(self.UserParams['cache_dir'], max_mb=self.UserParams.get('cache_max_mb', 1000))
+        else:
+            self.cache = None
+
+        # wall time and memory of each stage of get_cls; see timing.StageTimer for how to export these
+        self.timer = StageTimer(trace_memory=bool(self.UserParams.get('trace_memory', False)))
+
         # initialize empty dictionaries to be filled in later with results and their params
         self.loop_runids = []
         self.results = {}
         self.result_parameters = {}
+        self.grid_indices = {}  # position of each loop_sims run in the full Cartesian product of ITERABLES
+        self.swept_params = {}  # values of the ITERABLES for each loop_sims run
+
+    def _plan_multipoles(self):
+        """
+        sets max_l_use, max_l_calc, l_output and binning, and the CAMBparams max_l, max_l_tensor (and, with an
+        accuracy preset, max_eta_k and the Accuracy boosts) from the current values of _PLAN_KEYS; does nothing
+        if none of them has changed since the last call
+        """
+        inputs = json.dumps([self.UserParams.get(k) for k in _PLAN_KEYS], default=lambda x: np.asarray(x).tolist())
+        if inputs == self._plan_inputs:
+            return
+        self._plan_inputs = inputs
+
+        # the beam only limits the multipoles when noise is added (or will be, by augment.NoiseAugmentation)
+        self.max_l_use = int(self.UserParams['max_l_use'])
+        if (self.UserParams['noise_type'] is not None) and (self.UserParams['noise_uKarcmin'] > 0):
+            self.max_l_use = min(self.max_l_use, int(noise.max_multipole(self.UserParams['beamfwhm_arcmin'])))
+        # a named accuracy preset derives extra_l, max_l_tensor, max_eta_k and the Accuracy boosts from the
+        # multipole range; otherwise, according to the CAMB documentation, errors affect the last "100 or so"
+        # multipoles, and extra_l more are computed
+        self.accuracy_preset = self.UserParams.get('accuracy_preset')
+        if self.accuracy_preset is not None:
+            settings = presets.preset_settings(self.accuracy_preset, self.max_l_use)
+            for k, v in settings.items():
+                if k != 'extra_l':
+                    self._override(k, v)
+            self.max_l_calc = settings['max_l']
+        else:
+            self._restore(['max_l', 'max_l_tensor', 'max_eta_k', 'max_eta_k_tensor', 'Accuracy'])
+            self.max_l_calc = int(self.max_l_use + self.UserParams['extra_l'])
+            self.CAMBparams.max_l = self.max_l_calc
+            self.CAMBparams.max_l_tensor = self.max_l_calc
+
+        # multipoles at which the power spectra are returned and stored; None for every multipole up to max_l_use
+        l_sampling = self.UserParams.get('L_SAMPLING') or {}
+        self.l_output = _sampled_multipoles(l_sampling, self.max_l_use)
+        if (self.l_output is not None) and bool(l_sampling.get('camb_log_lvalues', True)):
+            self._override('Log_lvalues', True)
+        else:
+            self._restore(['Log_lvalues'])
+
+        # band powers stored by savecls, save_sweep and loop_sims(outfile=...) instead of the spectra; None to store
+        # the spectra at every multipole of l_output
+        self.binning = Binning.from_config(self.UserParams.get('BINNING'),
+                                           np.arange(self.max_l_use + 1) if self.l_output is None else self.l_output)
+
+    def _override(self, key, value):
+        """
+        sets the CAMBparams attribute key (whose value may be a dictionary of nested attributes, as in
+        base_config.yaml) to value for the plan, and remembers its value before the first override
+        """
+        if key not in self._unplanned:
+            current = getattr(self.CAMBparams, key)
+            self._unplanned[key] = {k: getattr(current, k) for k in value} if isinstance(value, dict) else current
+        _set_camb_attr(self.CAMBparams, key, value)
+
+    def _restore(self, keys):
+        """
+        restores the CAMBparams attributes in keys that the plan has overridden to their values before the override
+        """
+        for key in keys:
+            if key in self._unplanned:
+                _set_camb_attr(self.CAMBparams, key, self._unplanned.pop(key))
+
+    def _output_camb_params(self, cls_needed):
+        """
+        CAMBparams for a calculation of only the spectra in cls_needed, which leaves out the work that they do not
+        need: the tensors, which only enter the CMB spectra, are computed to l=100 rather than max_l_tensor if
+        only the lensing potential is requested, and the lensing potential is not computed if the CMB is not
+        lensed and no clP* spectrum is requested
+
+        Returns
+        -------
+        tuple
+            (CAMBparams, dict of the attributes that differ from self.CAMBparams); the CAMBparams is
+            self.CAMBparams itself if nothing differs
+        """
+        changes = {}
+        if not any(k in cls_needed for k in ['clTT', 'clEE', 'clBB', 'clTE']) and self.CAMBparams.max_l_tensor > 100:
+            # CAMB needs tensors whenever r > 0, but they do not change the lensing potential
+            changes['max_l_tensor'] = 100
+            changes['max_eta_k_tensor'] = min(self.CAMBparams.max_eta_k_tensor, 250.)
+        if not self.CAMBparams.DoLensing and not any(k in cls_needed for k in ['clPP', 'clPT', 'clPE']):
+            changes['Want_CMB_lensing'] = False
+        if not changes:
+            return self.CAMBparams, changes
+        params = self.CAMBparams.copy()
+        for k, v in changes.items():
+            setattr(params, k, v)
+        return params, changes
 
     def get_noise(self):
         """
@@ -64,11 +196,9 @@ class CAMBPowerSpectrum:
             shape is (2, max_l_use)
         """
         if self.UserParams['noise_type'] == 'detector-white':
-            t_noise = noise.detector_white_noise(self.UserParams['noise_uKarcmin'], self.UserParams['beamfwhm_arcmin'], self.max_l_use,
-                                                 TT=True)
-            eb_noise = noise.detector_white_noise(self.UserParams['noise_uKarcmin'], self.UserParams['beamfwhm_arcmin'], self.max_l_use,
-                                                  TT=False)
-            return t_noise, eb_noise
+            # cached, so the beam is only computed once for every grid point of loop_sims
+            return noise.detector_white_noise_batch(self.UserParams['noise_uKarcmin'], self.UserParams['beamfwhm_arcmin'],
+                                                    self.max_l_use)[0]
         elif self.UserParams['noise_type'] is None:
             return np.zeros((2, self.max_l_use))
         else:
@@ -91,101 +221,457 @@ class CAMBPowerSpectrum:
         -------
         dict
             dictionary of values of l, clTT, clEE, clBB, clTE, clPP, clPT, clPE
-        """
-        if bool(self.UserParams["verbose"]):
-            time_start = dt.now()
 
-        # main calculation: https://camb.readthedocs.io/en/latest/camb.html#camb.get_results
-        results = camb.get_results(self.CAMBparams)
+        Notes
+        -----
+        the wall time and memory of each stage of the calculation are recorded in self.timer.records[save_to_dict]
+        """
+        run_id = save_to_dict
+        time_start, perf_start, maxrss_start = dt.now(), time.perf_counter(), _maxrss_bytes()
+        self._plan_multipoles()
 
-        outdict = { 'l': range(self.max_l_use + 1) }
+        outdict = { 'l': range(self.max_l_use + 1) if self.l_output is None else self.l_output }
         if self.UserParams['cls_to_output'] == 'all':
             cls_needed = ['clTT', 'clEE', 'clBB', 'clTE', 'clPP', 'clPT', 'clPE']
         else:
             cls_needed = self.UserParams['cls_to_output']
 
-        # https://camb.readthedocs.io/en/latest/results.html#camb.results.CAMBdata.get_total_cls
-        if ('clTT' in cls_needed) or ('clEE' in cls_needed) or ('clEB' in cls_needed) or ('clTE' in cls_needed):
-            # need to run things to get one/some/all of tt, ee, bb, te
-            tt, ee, bb, te = results.get_total_cls(raw_cl=self.normalize_cls, CMB_unit=self.TT_units)[:self.max_l_use + 1].T
-            # add noise
-            if self.UserParams['noise_type'] is not None:
+        # noiseless spectra, either from the cache or from the main calculation
+        if self.cache is not None:
+            with self.timer.stage(run_id, 'cache_lookup'):
+                cache_key = self.cache.key(self.camb_params_to_dict(user_params=False), self.max_l_calc, self.max_l_use,
+                                           cls_needed, self.normalize_cls, self.TT_units)
+                cls = self.cache.get(cache_key)
+            if cls is None:
+                cls = self._camb_cls(cls_needed, run_id)
+                self.cache.put(cache_key, cls)
+        else:
+            cls = self._camb_cls(cls_needed, run_id)
+
+        # add noise after the cache lookup, so that one cached calculation serves every noise configuration; with
+        # add_noise False the spectra stay noiseless, and noise is added when they are read by augment.NoiseAugmentation
+        if (self.UserParams['noise_type'] is not None) and bool(self.UserParams.get('add_noise', True)) \
+                and any(k in cls for k in ['clTT', 'clEE', 'clBB', 'clTE']):
+            with self.timer.stage(run_id, 'noise'):
                 _noise = self.get_noise()
-                tt += _noise[0]
-                ee += _noise[1]
-                bb += _noise[1]
-                te += _noise[1]
-            # now add to outdict
-            for key in ['clTT', 'clEE', 'clBB', 'clTE']:
-                if key in cls_needed:
-                    if key == 'clTT':
-                        outdict[key] = tt
-                    elif key == 'clEE':
-                        outdict[key] = ee
-                    elif key == 'clBB':
-                        outdict[key] = bb
-                    elif key == 'clTE':
-                        outdict[key] = te
-                    else:
-                        raise ValueError('somethings wrong.')
+                for key in ['clTT', 'clEE', 'clBB', 'clTE']:
+                    if key in cls:
+                        cls[key] = cls[key] + (_noise[0] if key == 'clTT' else _noise[1])
 
-        # https://camb.readthedocs.io/en/latest/results.html#camb.results.CAMBdata.get_lens_potential_cls
-        if ('clPP' in cls_needed) or ('clPT' in cls_needed) or ('clPE' in cls_needed):
-            pp, pt, pe = results.get_lens_potential_cls(raw_cl=self.normalize_cls)[:self.max_l_use + 1].T
-            # now add to outdict
-            for key in ['clPP', 'clPT', 'clPE']:
-                if key in cls_needed:
-                    if key == 'clPP':
-                        outdict[key] = pp
-                    elif key == 'clPT':
-                        outdict[key] = pt
-                    elif key == 'clPE':
-                        outdict[key] = pe
-                    else:
-                        raise ValueError('somethings wrong.')
+        # now add to outdict
+        for key in ['clTT', 'clEE', 'clBB', 'clTE', 'clPP', 'clPT', 'clPE']:
+            if key in cls_needed:
+                outdict[key] = cls[key] if self.l_output is None else cls[key][self.l_output]
+
+        if save_to_dict is not None:
+            with self.timer.stage(run_id, 'param_serialization'):
+                self.results[save_to_dict] = outdict
+                self.result_parameters[save_to_dict] = self.camb_params_to_dict(user_params=user_params).copy()
 
+        total = time.perf_counter() - perf_start
+        self.timer.add(run_id, 'total', {'wall_s': total, 'maxrss_increase_bytes': _maxrss_bytes() - maxrss_start})
         if bool(self.UserParams["verbose"]):
             time_end = dt.now()
-            print('from', dt.strftime(time_start, '%H:%M:%S.%f %P'), 'to', dt.strftime(time_end, '%H:%M:%S.%f %P'),
-                  end=" ")
-            print('or', str((time_end - time_start).seconds) + '.' + str((time_end - time_start).microseconds),
-                  'seconds total')
+            print('from', dt.strftime(time_start, '%H:%M:%S.%f %p'), 'to', dt.strftime(time_end, '%H:%M:%S.%f %p'),
+                  f'or {total:.6f} seconds total')
 
-        if save_to_dict is not None:
-            self.results[save_to_dict] = outdict
-            self.result_parameters[save_to_dict] = self.camb_params_to_dict(user_params=user_params).copy()
-        else:
+        if save_to_dict is None:
             return outdict
 
-    def loop_sims(self, user_params=True):
+    def _camb_cls(self, cls_needed, run_id=None):
+        """
+        runs CAMB for the current CAMBparams
+
+        Parameters
+        ----------
+        cls_needed : list of str
+            subset of ['clTT', 'clEE', 'clBB', 'clTE', 'clPP', 'clPT', 'clPE']
+        run_id : str, optional
+            run under which to record the time taken by each stage
+
+        Returns
+        -------
+        dict
+            noiseless power spectra up to max_l_use for each entry of cls_needed
+        """
+        params, changes = self._output_camb_params(cls_needed)
+        if self.reuse_transfers:
+            # https://camb.readthedocs.io/en/latest/camb.html#camb.get_transfer_functions
+            signature = self._transfer_signature() + json.dumps(changes, sort_keys=True)
+            if signature != self._transfers_signature:
+                with self.timer.stage(run_id, 'get_transfer_functions'):
+                    self._transfers = camb.get_transfer_functions(params)
+                self._transfers_signature = signature
+            results = self._transfers
+            results.Params.Alens = self.CAMBparams.Alens
+            # https://camb.readthedocs.io/en/latest/results.html#camb.results.CAMBdata.power_spectra_from_transfer
+            with self.timer.stage(run_id, 'power_spectra_from_transfer'):
+                results.power_spectra_from_transfer(self.CAMBparams.InitPower, silent=True)
+        else:
+            # main calculation: https://camb.readthedocs.io/en/latest/camb.html#camb.get_results
+            with self.timer.stage(run_id, 'get_results'):
+                results = camb.get_results(params)
+
+        cls = {}
+        # https://camb.readthedocs.io/en/latest/results.html#camb.results.CAMBdata.get_total_cls
+        if ('clTT' in cls_needed) or ('clEE' in cls_needed) or ('clBB' in cls_needed) or ('clTE' in cls_needed):
+            # need to run things to get one/some/all of tt, ee, bb, te
+            with self.timer.stage(run_id, 'get_total_cls'):
+                tt, ee, bb, te = results.get_total_cls(raw_cl=self.normalize_cls, CMB_unit=self.TT_units)[:self.max_l_use + 1].T
+            cls.update({'clTT': tt, 'clEE': ee, 'clBB': bb, 'clTE': te})
+
+        # https://camb.readthedocs.io/en/latest/results.html#camb.results.CAMBdata.get_lens_potential_cls
+        if ('clPP' in cls_needed) or ('clPT' in cls_needed) or ('clPE' in cls_needed):
+            with self.timer.stage(run_id, 'get_lens_potential_cls'):
+                pp, pt, pe = results.get_lens_potential_cls(raw_cl=self.normalize_cls)[:self.max_l_use + 1].T
+            cls.update({'clPP': pp, 'clPT': pt, 'clPE': pe})
+
+        return {k: v for k, v in cls.items() if k in cls_needed}
+
+    def _transfer_invariant_keys(self):
+        """
+        Returns
+        -------
+        list of str
+            dotted names of the CAMBparams attributes that can change without recomputing the transfer functions
+        """
+        initpower = _TENSOR_INITPOWER
+        if self.CAMBparams.NonLinear not in ['NonLinear_lens', 'NonLinear_both']:
+            initpower = initpower + _SCALAR_INITPOWER
+        return ['Alens'] + ['InitPower.' + x for x in initpower]
+
+    def _reuses_transfers(self, key):
         """
-        method for looping get_cls() over a range of values specified in the user_config.yaml file
+        whether a parameter in ITERABLES can be changed without recomputing the transfer functions, because
+        it only enters the primordial power or the lensing amplitude, or because it is not a CAMB parameter and
+        does not change the multipole range
+        """
+        return (key in self._transfer_invariant_keys()) or ((key in self.UserParams) and (key not in _PLAN_KEYS))
+
+    def _transfer_signature(self):
+        """
+        Returns
+        -------
+        str
+            hash of all CAMBparams except those listed by _transfer_invariant_keys, which is unchanged as long as
+            the transfer functions of the current CAMBparams can be reused
+        """
+        cpd = self.camb_params_to_dict(user_params=False)
+        for key in self._transfer_invariant_keys():
+            outer, _, inner = key.partition('.')
+            if inner:
+                cpd[outer] = {k: v for k, v in cpd[outer].items() if k != inner}
+            else:
+                cpd.pop(outer, None)
+        return SpectraCache.key(cpd)
+
+    def loop_sims(self, user_params=True, processes=None, shard_index=None, shard_count=None,
+                  checkpoint_dir=None, resume=False, outfile=None, keep_results=None):
+        """
+        method for looping get_cls() over a range of values specified in the user_config.yaml file, either the
+        Cartesian product of the ITERABLES or, if the SAMPLER design is not 'grid', a sample from their ranges
         automatically saves results to self.results and parameters to self.result_parameters using
-        unique identifiers
+        unique identifiers, the position of each run in the full grid to self.grid_indices, and the
+        values of the ITERABLES of each run to self.swept_params
 
         Parameters
         ----------
         user_params : bool, default True
             if save_to_dict is not None, then user_params=True saves only the CAMBparams that differ
             from the base_config in the result_parameters dict
+        processes : int, optional
+            number of worker processes among which to divide the loop. If not specified, this is read
+            from `processes` in the user_config.yaml file, and defaults to 1 (serial). Each worker rebuilds
+            its own config_obj from the yaml files, so the results are identical to a serial loop.
+            Points are ordered so that points which share transfer functions (i.e. which differ only in
+            InitPower, Alens, or UserParams values) are computed one after the other, which means that
+            the transfer functions only need to be computed once for each group of points
+        shard_index, shard_count : int, optional
+            compute only the shard_index-th of shard_count disjoint slices of the grid, so that a large
+            grid can be split among independent jobs and recombined with sweep_io.merge_shards. If not
+            specified, these are read from `shard_index` and `shard_count` in the user_config.yaml file,
+            and default to the whole grid
+        checkpoint_dir : str, optional
+            if specified, each run is saved to this directory (in the format of savecls) as soon as it
+            is computed, and its run ID is derived from a hash of its parameter vector and of the rest of the
+            configuration (see _fixed_config_hash) instead of the time
+        resume : bool, default False
+            if True, grid points that have already been saved to checkpoint_dir are read back from disk
+            instead of being recomputed. These runs come first in self.loop_runids. Checkpointed runs that are
+            missing from outfile (because an interrupted loop had not yet written them there) are appended to it
+        outfile : str, optional
+            if specified, each newly computed run is appended to this single hdf5 file with
+            sweep_io.SweepWriter as soon as it is computed (as band powers, if BINNING is set)
+        keep_results : bool, optional
+            if False, each run is removed from self.results, self.result_parameters, self.grid_indices,
+            self.swept_params and self.timer.records (and left out of self.loop_runids) once it has been written to
+            checkpoint_dir and/or outfile, so that memory use does not grow with the size of the sweep. If not specified, this is read from `keep_results` in the
+            user_config.yaml file, and defaults to True.
+            Runs are written by a background thread while the next runs are computed; the loop waits whenever
+            `writer_queue_size` runs are waiting to be written
 
         Returns
         -------
         None
         """
+        # BINNING (and the multipoles it bins) may have been changed with update_val since the last plan
+        self._plan_multipoles()
+        processes = processes if processes is not None else self.UserParams.get('processes', 1)
+        shard_index = shard_index if shard_index is not None else self.UserParams.get('shard_index', 0)
+        shard_count = shard_count if shard_count is not None else self.UserParams.get('shard_count', 1)
+        keep_results = keep_results if keep_results is not None else self.UserParams.get('keep_results', True)
+        if not keep_results and (checkpoint_dir is None) and (outfile is None):
+            raise ValueError("keep_results=False discards every run, unless checkpoint_dir or outfile is given")
         iterables = self.UserParams['ITERABLES']
-        keys, values = list(iterables.keys()), iterables.values()
-        for vector in itertools.product(*values):
-            for i in range(len(vector)):
-                self.update_val(keys[i], vector[i])
-            _single_param_id = _generate_run_id()
-            self.loop_runids.append(_single_param_id)
-            self.get_cls(save_to_dict=_single_param_id, user_params=user_params)
+        keys = list(iterables.keys())
+        grid_indices, vectors = [], []
+        for grid_index, vector in _grid_points(iterables, shard_index=shard_index, shard_count=shard_count,
+                                               sampler=self.UserParams.get('SAMPLER')):
+            grid_indices.append(grid_index)
+            vectors.append(vector)
+        if checkpoint_dir is not None:
+            config_hash = self._fixed_config_hash(keys)
+            run_ids = ['runid_' + _param_hash(keys, vector, config_hash) for vector in vectors]
+        else:
+            run_ids = [_generate_run_id() for _ in vectors]
+
+        unwritten = []
+        if resume and (checkpoint_dir is not None):
+            # runs are checkpointed before their buffered rows are written to outfile, so an interrupted loop can
+            # leave checkpointed runs that are missing from outfile; these are appended to it from the checkpoints
+            in_outfile = set()
+            if (outfile is not None) and os.path.exists(outfile):
+                with h5py.File(outfile, 'r') as f:
+                    in_outfile = set(f['run_id'].asstr()[()]) if 'run_id' in f else set()
+            todo = []
+            for run_id, grid_index, vector in zip(run_ids, grid_indices, vectors):
+                if os.path.exists(os.path.join(checkpoint_dir, f"{run_id}_results.h5")):
+                    if keep_results:
+                        self.results[run_id], self.result_parameters[run_id], _, _ = sweep_io.read_run(checkpoint_dir, run_id)
+                        self.loop_runids.append(run_id)
+                        self.grid_indices[run_id], self.swept_params[run_id] = grid_index, dict(zip(keys, vector))
+                    if (outfile is not None) and (run_id not in in_outfile):
+                        unwritten.append((run_id, grid_index, vector))
+                else:
+                    todo.append((run_id, grid_index, vector))
+            if bool(self.UserParams["verbose"]):
+                print(f"resuming from {checkpoint_dir}: {len(vectors) - len(todo)} of {len(vectors)} runs already done")
+            run_ids, grid_indices, vectors = [x[0] for x in todo], [x[1] for x in todo], [x[2] for x in todo]
+        self.grid_indices.update(zip(run_ids, grid_indices))
+        self.swept_params.update((run_id, dict(zip(keys, vector))) for run_id, vector in zip(run_ids, vectors))
+
+        # group together the points that share transfer functions, which stay in grid order within a group
+        order, group_of = _transfer_order(self, keys, vectors)
+        run_ids, vectors = [run_ids[j] for j in order], [vectors[j] for j in order]
+        self._transfers, self._transfers_signature = None, None
+
+        writer = sweep_io.SweepWriter(outfile, keys, storage=self.UserParams.get('STORAGE'),
+                                      binning=self.binning) if outfile is not None else None
+        for run_id, grid_index, vector in unwritten:
+            results, params, _, _ = sweep_io.read_run(checkpoint_dir, run_id)
+            writer.append(run_id, results if self.binning is None else self.binning.bin_dict(results), dict(zip(keys, vector)),
+                          grid_index=grid_index, run_params=params)
+        background = None
+        if (checkpoint_dir is not None) or (writer is not None):
+            background = sweep_io.BackgroundWriter(lambda run_id: self._store_run(run_id, checkpoint_dir, writer, keep_results),
+                                                   queue_size=self.UserParams.get('writer_queue_size', 4))
+        try:
+            self._loop_points(keys, run_ids, vectors, group_of, user_params, processes, background, keep_results)
+        finally:
+            try:
+                if background is not None:
+                    background.close()
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    def _fixed_config_hash(self, keys):
+        """
+        hash of every CAMBparams and UserParams value that can change a checkpointed run, except the swept keys
+        and the UserParams in _EXECUTION_KEYS, so that resume does not reload runs computed with another
+        configuration
+        """
+        camb_params = self.camb_params_to_dict(False)
+        for key in keys:
+            outer, _, inner = key.partition('.')
+            if inner and isinstance(camb_params.get(outer), dict):
+                camb_params[outer].pop(inner, None)
+            elif not inner:
+                camb_params.pop(outer, None)
+        user_params = {k: v for k, v in self.UserParams.items() if (k not in keys) and (k not in _EXECUTION_KEYS)}
+        canonical = json.dumps([camb_params, user_params], sort_keys=True, default=lambda x: np.asarray(x).tolist())
+        return hashlib.sha1(canonical.encode()).hexdigest()
+
+    def _loop_points(self, keys, run_ids, vectors, group_of, user_params, processes, background, keep_results=True):
+        """
+        computes the points of loop_sims, in order, and queues each run to be stored by background (if any) as soon
+        as it is computed; the runs are only added to self.loop_runids if keep_results
+        """
+        if int(processes) > 1:
+            # each task is a run of consecutive points from one group, so that every worker reuses its transfer
+            # functions; groups are split when there are fewer groups than processes
+            chunks = _group_chunks(vectors, group_of, processes)
+            with _worker_pool(self, processes) as executor:
+                # executor.map yields in submission order, so results stream back in the same order as the serial loop
+                chunk_results = executor.map(_worker_get_cls, itertools.repeat(keys), chunks, itertools.repeat(user_params))
+                for run_id, (outdict, params, timings) in zip(run_ids, itertools.chain.from_iterable(chunk_results)):
+                    if keep_results:
+                        self.loop_runids.append(run_id)
+                    self.results[run_id] = outdict
+                    self.result_parameters[run_id] = params
+                    for stage, measurement in timings.items():
+                        self.timer.add(run_id, stage, measurement)
+                    if background is not None:
+                        background.put(run_id)
+        else:
+            # CAMB caches tables (e.g. Bessel functions) between calls; start from a clean slate like a fresh worker
+            camb.free_global_memory()
+            for run_id, vector in zip(run_ids, vectors):
+                for i in range(len(vector)):
+                    self.update_val(keys[i], vector[i])
+                if keep_results:
+                    self.loop_runids.append(run_id)
+                self.get_cls(save_to_dict=run_id, user_params=user_params)
+                if background is not None:
+                    background.put(run_id)
+
+    def get_cls_batch(self, param_table, processes=None):
+        """
+        computes the power spectra of many parameter points at once, e.g. for an MCMC driver or an emulator
+        training loop, without run IDs or per-point entries in self.results
+
+        Parameters
+        ----------
+        param_table : numpy structured array or dict
+            values of the parameters at each point, either as a structured array whose field names are the
+            parameters, or as a dictionary of equal-length arrays (scalars are broadcast). The parameters are
+            dotted names of CAMBparams attributes, e.g. 'InitPower.r', or keys of UserParams, as in update_val
+        processes : int, optional
+            number of worker processes among which to divide the points. If not specified, this is read from
+            `processes` in the user_config.yaml file, and defaults to 1 (serial). As in loop_sims, the points
+            that share transfer functions are computed one after the other, and the cache (if any) is used
+
+        Returns
+        -------
+        dict
+            'l', and for each spectrum returned by get_cls an (n, n_ell) array whose rows are in the order of
+            param_table. The parameters are restored to their values before the call
+        """
+        processes = processes if processes is not None else self.UserParams.get('processes', 1)
+        if getattr(getattr(param_table, 'dtype', None), 'names', None) is not None:
+            columns = {k: param_table[k] for k in param_table.dtype.names}
+        else:
+            columns = dict(param_table)
+        keys = list(columns.keys())
+        if len(keys) == 0:
+            raise ValueError("param_table has no parameters")
+        arrays = np.broadcast_arrays(*[np.atleast_1d(np.asarray(columns[k])) for k in keys])
+        if arrays[0].ndim != 1:
+            raise ValueError("every parameter of param_table must be a scalar or a one-dimensional array")
+        vectors = list(zip(*[a.tolist() for a in arrays]))
+        if len(vectors) == 0:
+            raise ValueError("param_table has no points")
+        originals = {k: self._current_val(k) for k in keys}
+
+        # compute the points that share transfer functions one after the other; out[j] is filled for point j
+        order, group_of = _transfer_order(self, keys, vectors)
+        out = {}
+
+        def store(j, outdict):
+            if not out:
+                out['l'] = outdict['l']
+                out.update({k: np.empty((len(vectors), len(v)), dtype=np.asarray(v).dtype)
+                            for k, v in outdict.items() if k != 'l'})
+            elif not np.array_equal(outdict['l'], out['l']):
+                raise ValueError("the points of param_table give spectra at different multipoles, so they cannot be "
+                                 "stacked; keep the parameters that set the multipole range fixed")
+            for k in out:
+                if k != 'l':
+                    out[k][j] = outdict[k]
+
+        try:
+            if int(processes) > 1:
+                chunks = _group_chunks(order, lambda j: group_of(vectors[j]), processes)
+                with _worker_pool(self, processes) as executor:
+                    chunk_results = executor.map(_worker_get_cls_batch, itertools.repeat(keys),
+                                                 [[vectors[j] for j in c] for c in chunks])
+                    for j, outdict in zip(itertools.chain.from_iterable(chunks),
+                                          itertools.chain.from_iterable(chunk_results)):
+                        store(j, outdict)
+            else:
+                for j in order:
+                    for k, v in zip(keys, vectors[j]):
+                        self.update_val(k, v)
+                    store(j, self.get_cls())
+        finally:
+            for k, v in originals.items():
+                self.update_val(k, v)
+            self._plan_multipoles()
+        return out
+
+    def _current_val(self, key):
+        """
+        current value of a dotted name of a CAMBparams attribute or of a key of UserParams, as set by update_val
+        """
+        outer, _, inner = key.partition('.')
+        if hasattr(self.CAMBparams, outer) and ((not inner) or hasattr(getattr(self.CAMBparams, outer), inner)):
+            return getattr(getattr(self.CAMBparams, outer), inner) if inner else getattr(self.CAMBparams, outer)
+        if key in self.UserParams:
+            return self.UserParams[key]
+        raise ValueError(f"{key} is neither an attribute of CAMBparams nor a key of UserParams")
+
+    def _store_run(self, run_id, checkpoint_dir, writer, keep_results=True):
+        """
+        writes a newly computed loop_sims run to the checkpoint directory and/or the sweep file, if any, and then
+        removes it from memory unless keep_results, including its timing record (whose totals stay in
+        self.timer.summary() and have been passed to the collectors); this is called by the background writer
+        thread of loop_sims
+        """
+        if checkpoint_dir is not None:
+            # checkpoints are never binned or stored at reduced precision, so that resumed runs are the same as
+            # newly computed ones
+            self._save_run(checkpoint_dir, run_id)
+        if writer is not None:
+            outdict = self.results[run_id] if self.binning is None else self.binning.bin_dict(self.results[run_id])
+            writer.append(run_id, outdict, self.swept_params[run_id],
+                          grid_index=self.grid_indices[run_id], run_params=self.result_parameters[run_id])
+            writer.flush(min_interval_s=10)  # at most about 10 s of runs are lost if the loop is interrupted
+        if not keep_results:
+            for record in [self.results, self.result_parameters, self.grid_indices, self.swept_params,
+                           self.timer.records]:
+                record.pop(run_id, None)
+
+    def binned_results(self, run_ids=None):
+        """
+        band powers of many runs, binned with self.binning in one matrix multiplication per spectrum
+
+        Parameters
+        ----------
+        run_ids : list of str, optional
+            runs to bin; by default, all runs made by loop_sims
+
+        Returns
+        -------
+        dict
+            {run_id: dictionary of band powers in the format of get_cls, with the mean multipole of each bin as 'l'}
+        """
+        self._plan_multipoles()
+        run_ids = list(run_ids) if run_ids is not None else self.loop_runids
+        out = {run_id: {'l': self.binning.l_eff} for run_id in run_ids}
+        if len(run_ids) == 0:
+            return out
+        for k in self.results[run_ids[0]]:
+            if k != 'l':
+                band_powers = self.binning(np.stack([self.results[run_id][k] for run_id in run_ids]))
+                for run_id, band_power in zip(run_ids, band_powers):
+                    out[run_id][k] = band_power
+        return out
 
     def savecls(self, savedir=os.path.join(os.getcwd(), "outfiles"),
                 saveids=None, randomids=False, permission='w', overwrite=False):
         """
-        method for saving power spectra
+        method for saving power spectra, or their band powers if BINNING is set in the user_config.yaml file, with
+        the dtype and compression set by STORAGE
 
         Parameters
         ----------
@@ -204,9 +690,10 @@ class CAMBPowerSpectrum:
         -------
         None
         """
-        if not os.path.exists(os.path.join(os.getcwd(), "outfiles")):
-            print("making local directory `./outfiles`")
-            os.mkdir(os.path.join(os.getcwd(), "outfiles"))
+        self._plan_multipoles()
+        if not os.path.exists(savedir):
+            print(f"making directory `{savedir}`")
+            os.makedirs(savedir)
         if saveids is not None:
             if type(saveids) == int:
                 saveids = np.random.choice(range(len(self.loop_runids)), saveids, replace=False) if randomids else self.loop_runids[:saveids]
@@ -220,16 +707,277 @@ class CAMBPowerSpectrum:
         else:
             saveids = self.loop_runids
 
+        binned = self.binned_results(saveids) if self.binning is not None else {}
         for run_id in saveids:
             if True or overwrite:  # todo check to see if results with these parameters have already been run
-                with h5py.File(os.path.join(savedir, f"{run_id}_results.h5"), permission) as f:
-                    for k, v in self.results[run_id].items():
-                        f.create_dataset(k, data=v)
-                with open(os.path.join(savedir, f"{run_id}_params.yaml"), permission) as f:
-                    json.dump(self.result_parameters[run_id], f, default=lambda x: x.tolist())
+                self._save_run(savedir, run_id, permission=permission, outdict=binned.get(run_id),
+                               storage=self.UserParams.get('STORAGE'))
             else:
                 print(f"skipping because {run_id}/parameters already exists and overwrite set to False")
 
+    def _save_run(self, savedir, run_id, permission='w', outdict=None, storage=None):
+        """
+        saves a single run in the format of savecls, with outdict (e.g. band powers) in place of its results if
+        given, and with the dtype and compression of storage (as in UserParams['STORAGE']) if given. The results
+        file is written under a temporary name and then renamed, so that an interrupted write never leaves a file
+        that looks complete
+        """
+        if not os.path.exists(savedir):
+            os.makedirs(savedir, exist_ok=True)
+        with open(os.path.join(savedir, f"{run_id}_params.yaml"), permission) as f:
+            json.dump(self.result_parameters[run_id], f, default=lambda x: x.tolist())
+        results_file = os.path.join(savedir, f"{run_id}_results.h5")
+        storage = storage or {}
+        options = sweep_io.dataset_options(storage)
+        with h5py.File(results_file + ".tmp", permission) as f:
+            for k, v in (outdict if outdict is not None else self.results[run_id]).items():
+                if k == 'l':
+                    f['l'] = sweep_io.shared_multipoles_link(savedir, v) if storage.get('shared_l') else v
+                else:
+                    f.create_dataset(k, data=sweep_io._to_dtype(v, options['dtype']), **options)
+            if run_id in self.grid_indices:
+                f.attrs['grid_index'] = self.grid_indices[run_id]
+                f.attrs['swept_params'] = json.dumps(self.swept_params[run_id], default=lambda x: np.asarray(x).tolist())
+        os.replace(results_file + ".tmp", results_file)
+
+
+    def save_sweep(self, outfile, saveids=None, mode='w'):
+        """
+        method for saving many runs to a single hdf5 file with sweep_io.SweepWriter, rather than two files per run;
+        if BINNING is set in the user_config.yaml file, the band powers of every run are saved
+
+        Parameters
+        ----------
+        outfile : str
+            path to the hdf5 file
+        saveids : list of str, optional
+            IDs of the runs to save; by default, all runs made by loop_sims
+        mode : {'w', 'a', 'w-'}, default 'w'
+            permission settings for the file. With 'a', the runs are appended to those already in the file
+
+        Returns
+        -------
+        None
+        """
+        self._plan_multipoles()
+        saveids = saveids if saveids is not None else self.loop_runids
+        param_names = list(self.UserParams['ITERABLES'].keys())
+        results = self.binned_results(saveids) if self.binning is not None else self.results
+        with sweep_io.SweepWriter(outfile, param_names, mode=mode, storage=self.UserParams.get('STORAGE'),
+                                  binning=self.binning) as writer:
+            for run_id in saveids:
+                writer.append(run_id, results[run_id], self.swept_params.get(run_id, {}),
+                              grid_index=self.grid_indices.get(run_id, -1), run_params=self.result_parameters[run_id])
+
+
+def _grid_points(iterables, shard_index=0, shard_count=1, sampler=None):
+    """
+    deterministic slice of the Cartesian product of a dictionary of iterables, or of a seeded sample from the
+    ranges of the iterables. Points are dealt out round-robin, so the shards are disjoint, together cover the
+    whole grid, and differ in size by at most one
+
+    Parameters
+    ----------
+    iterables : dict
+        dictionary of arrays of values, as in UserParams['ITERABLES']
+    shard_index : int, default 0
+        which slice of the grid to return, counting from 0
+    shard_count : int, default 1
+        total number of slices into which the grid is split
+    sampler : dict, optional
+        as in UserParams['SAMPLER']: if its `design` is not 'grid', `n_points` points are drawn with
+        sampling.sample_points using its `seed` instead of taking the Cartesian product
+
+    Returns
+    -------
+    iterator
+        yields (grid_index, vector) for every point of the shard, where grid_index is the position of
+        vector in the full Cartesian product or in the sample
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"shard_index must be between 0 and shard_count-1, but got {shard_index} of {shard_count}")
+    if (sampler is not None) and (sampler.get('design', 'grid') != 'grid'):
+        samples = sampling.sample_points(iterables, sampler['design'], sampler['n_points'], seed=sampler.get('seed'))
+        full_grid = enumerate(tuple(sample.tolist()) for sample in samples)
+    else:
+        full_grid = enumerate(itertools.product(*iterables.values()))
+    return itertools.islice(full_grid, shard_index, None, shard_count)
+
+
+def _sampled_multipoles(l_sampling, max_l_use):
+    """
+    multipoles at which the power spectra are returned, as specified by UserParams['L_SAMPLING']
+
+    Parameters
+    ----------
+    l_sampling : dict
+        with `spacing` (None, 'linear', 'log' or 'custom'), `n_l` and `l_min`, and `l_values` for 'custom'
+    max_l_use : int
+        largest multipole
+
+    Returns
+    -------
+    np.ndarray or None
+        sorted, distinct integer multipoles from l_min to max_l_use (at most n_l of them, because log spacing
+        is rounded to integers) or the l_values up to max_l_use, or None if spacing is None
+    """
+    spacing = l_sampling.get('spacing')
+    if spacing is None:
+        return None
+    l_min, max_l_use, n_l = int(l_sampling.get('l_min', 2)), int(max_l_use), int(l_sampling.get('n_l', 0))
+    if spacing == 'linear':
+        ls = np.linspace(l_min, max_l_use, n_l)
+    elif spacing == 'log':
+        ls = np.geomspace(max(l_min, 1), max_l_use, n_l)
+    elif spacing == 'custom':
+        ls = np.asarray(l_sampling['l_values'])
+        ls = ls[ls <= max_l_use]
+    else:
+        raise ValueError(f"L_SAMPLING spacing must be None, 'linear', 'log' or 'custom', not {spacing}")
+    return np.unique(np.round(ls).astype(int))
+
+
+def _param_hash(keys, vector, config_hash=''):
+    """
+    content hash of a parameter vector, which is independent of the order of the keys and of when
+    the hash is computed
+
+    Parameters
+    ----------
+    keys : list of str
+        names of the parameters, as in UserParams['ITERABLES']
+    vector : tuple
+        values of the parameters
+    config_hash : str, optional
+        hash of the rest of the configuration (see CAMBPowerSpectrum._fixed_config_hash), which is included
+        so that the same vector gives another hash under another configuration
+
+    Returns
+    -------
+    str
+        hexadecimal sha1 digest of the canonical json encoding of the (key, value) pairs and config_hash
+    """
+    canonical = json.dumps(sorted((k, np.asarray(v).item()) for k, v in zip(keys, vector)))
+    if config_hash:
+        canonical += config_hash
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+_worker_power_spectrum = None
+
+
+def _init_worker(user_config, base_config, updates, camb_params, user_params=None, unplanned=None):
+    """
+    initializer for the processes used by CAMBPowerSpectrum.loop_sims and get_cls_batch; builds a CAMBPowerSpectrum
+    that belongs only to this process from the yaml files, then replays the updates made in the parent and sets
+    every CAMBparams attribute and UserParams value to its value in the parent
+
+    Parameters
+    ----------
+    user_config, base_config : str
+        paths to the yaml files used by the parent config_obj
+    updates : dict
+        values changed through config_obj.update_val in the parent process
+    camb_params : dict
+        all CAMBparams of the parent process, as returned by camb_params_to_dict(user_params=False), so that
+        attributes that were set without update_val (e.g. CAMBparams.Accuracy.AccuracyBoost) are the same as well
+    user_params : dict, optional
+        UserParams of the parent process, so that values changed in place (e.g. UserParams['noise_uKarcmin'] = 50)
+        are the same as well
+    unplanned : dict, optional
+        CAMBPowerSpectrum._unplanned of the parent, i.e. the values that its multipole plan has overridden, so that
+        the worker restores the same values when the plan changes
+    """
+    global _worker_power_spectrum
+    worker_config = config_obj(user_config=user_config, base_config=base_config)
+    for k, v in updates.items():
+        worker_config.update_val(k, v, verbose=False)
+    for k, v in camb_params.items():
+        _set_camb_attr(worker_config.CAMBparams, k, v)
+    if user_params is not None:
+        worker_config.UserParams.clear()  # in place, since the config_obj holds other references to this dict
+        worker_config.UserParams.update(user_params)
+    _worker_power_spectrum = CAMBPowerSpectrum(worker_config)
+    if unplanned is not None:
+        _worker_power_spectrum._unplanned = dict(unplanned)
+
+
+def _worker_get_cls(keys, vectors, user_params):
+    """
+    computes a run of consecutive grid points of CAMBPowerSpectrum.loop_sims in a worker process
+
+    Returns
+    -------
+    list of tuple
+        the dictionary of power spectra, the dictionary of parameters, and the timing record for each grid point
+    """
+    out = []
+    for vector in vectors:
+        for k, v in zip(keys, vector):
+            _worker_power_spectrum.update_val(k, v)
+        _worker_power_spectrum.get_cls(save_to_dict='worker', user_params=user_params)
+        out.append((_worker_power_spectrum.results.pop('worker'), _worker_power_spectrum.result_parameters.pop('worker'),
+                    _worker_power_spectrum.timer.records.pop('worker')))
+    return out
+
+
+def _worker_get_cls_batch(keys, vectors):
+    """
+    computes a run of consecutive points of CAMBPowerSpectrum.get_cls_batch in a worker process
+
+    Returns
+    -------
+    list of dict
+        the dictionary of power spectra of each point
+    """
+    out = []
+    for vector in vectors:
+        for k, v in zip(keys, vector):
+            _worker_power_spectrum.update_val(k, v)
+        out.append(_worker_power_spectrum.get_cls())
+    return out
+
+
+def _transfer_order(power_spectrum, keys, vectors):
+    """
+    order in which to compute the parameter vectors of a CAMBPowerSpectrum, so that the points that share
+    transfer functions (i.e. which differ only in the keys for which _reuses_transfers is True) are consecutive;
+    the sort is stable, so within a group the points keep their order
+
+    Returns
+    -------
+    tuple
+        (list of the indices of vectors in that order, function that maps a vector to its group)
+    """
+    slow_keys = [i for i, k in enumerate(keys) if not power_spectrum._reuses_transfers(k)]
+    group_of = lambda vector: tuple(vector[i] for i in slow_keys)
+    return sorted(range(len(vectors)), key=lambda j: group_of(vectors[j])), group_of
+
+
+def _worker_pool(power_spectrum, processes):
+    """
+    pool of worker processes (see _init_worker) that each hold a copy of the configuration of power_spectrum, as
+    used by CAMBPowerSpectrum.loop_sims and get_cls_batch; spawned rather than forked, so that the workers do not
+    inherit CAMB's OpenMP state from this process
+    """
+    co = power_spectrum._config_obj
+    return ProcessPoolExecutor(max_workers=int(processes), mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker,
+                               initargs=(co.user_config, co.base_config, co.updates,
+                                         power_spectrum.camb_params_to_dict(False),
+                                         copy.deepcopy(power_spectrum.UserParams), power_spectrum._unplanned))
+
+
+def _group_chunks(items, group_of, processes):
+    """
+    splits items, which are ordered so that those with the same group_of are consecutive, into runs of
+    consecutive items from one group, so that every worker reuses its transfer functions; groups are split when
+    there are fewer groups than processes
+    """
+    groups = [list(g) for _, g in itertools.groupby(items, key=group_of)]
+    splits = int(np.ceil(int(processes) / len(groups))) if len(groups) > 0 else 1
+    return [[g[i] for i in c] for g in groups for c in np.array_split(np.arange(len(g)), splits) if len(c) > 0]
+
 
 def _generate_run_id(random_digits=6):
     """
@@ -1,9 +1,17 @@
 """
-optional module for plotting flat-sky map realizations of power spectra
+module for plotting flat-sky map realizations of power spectra, with `namaster` if it is installed and with
+the FFT generator of deepcmbsim.flatsky otherwise
 """
 
-import pymaster as nmt
 import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from deepcmbsim import flatsky
+
+try:
+    import pymaster as nmt
+except ModuleNotFoundError:
+    nmt = None
 
 
 class flatmap:
@@ -39,6 +47,9 @@ class flatmap:
     flatmap
         function for plotting a realization of a flat-sky map with the given number of pixels
         representing the given size of sky patch based on the provided power spectra
+    flatmaps
+        batched version of flatmap, for many realizations of one set of power spectra or one realization
+        of each of many sets of power spectra
     """
     def __init__(self, pixels, degrees, namaster_seed = -1, cl_dict = None):
         """
@@ -64,7 +75,28 @@ class flatmap:
 
     def _flatmap(self, cl_array, spin_array = [0], namaster_seed = None):
         namaster_seed = namaster_seed if namaster_seed is not None else self.namaster_seed
-        return nmt.synfast_flat(self.nx, self.ny, self.lx_rad, self.ly_rad, np.array([x for x in cl_array]), spin_array, namaster_seed = namaster_seed)
+        synfast_flat = nmt.synfast_flat if nmt is not None else flatsky.synfast_flat
+        return synfast_flat(self.nx, self.ny, self.lx_rad, self.ly_rad, np.array([x for x in cl_array]), spin_array, seed = namaster_seed)
+
+    @staticmethod
+    def _cl_array(maps_out, cl_dict):
+        """
+        array of power spectra and list of spins that namaster needs to make the maps in maps_out (see flatmap),
+        or None if maps_out is not a valid map specification
+        """
+        if len(maps_out)==1 and maps_out in ["T", "E", "B", "P"]:
+            cl_arr, spin_arr = np.array([cl_dict["cl"+maps_out*2]]), [0]
+        elif (len(maps_out)==2) and maps_out in ["TT", "EE", "BB", "TE", "PP", "PT", "PE"]:
+            cl_arr, spin_arr = np.array([cl_dict["cl"+maps_out]]), [0]
+        elif (len(maps_out)==4) and maps_out[:2]=='cl' and (maps_out[2:] in ["TT", "EE", "BB", "TE", "PP", "PT", "PE"]):
+            cl_arr, spin_arr = np.array([cl_dict[maps_out]]), [0]
+        elif maps_out=='TEB': # the cl_arr has to be in a specific order; we enforce by hand that the two other cross spectra TB and EB are zero
+            cl_arr, spin_arr = np.array([cl_dict["clTT"], cl_dict["clTE"], np.zeros_like(cl_dict["clTE"]), cl_dict["clEE"], np.zeros_like(cl_dict["clTE"]), cl_dict["clBB"]]), [0, 0, 0]
+        elif maps_out=='TQU': # the cl_arr has to be in a specific order; we enforce by hand that the two other cross spectra TB and EB are zero
+            cl_arr, spin_arr = np.array([cl_dict["clTT"], cl_dict["clTE"], np.zeros_like(cl_dict["clTE"]), cl_dict["clEE"], np.zeros_like(cl_dict["clTE"]), cl_dict["clBB"]]), [0, 2]
+        else:
+            return None
+        return cl_arr, spin_arr
 
     def flatmap(self, maps_out, namaster_seed = None):
         """
@@ -85,19 +117,114 @@ class flatmap:
             maps_out is "TEB" or "TQU"]) and Np is the number of pixels
         """
         if self.cl_dict is not None:
-            if len(maps_out)==1 and maps_out in ["T", "E", "B", "P"]:
-                cl_arr, spin_arr = np.array([self.cl_dict["cl"+maps_out*2]]), [0]
-            elif (len(maps_out)==2) and maps_out in ["TT", "EE", "BB", "TE", "PP", "PT", "PE"]:
-                cl_arr, spin_arr = np.array([self.cl_dict["cl"+maps_out]]), [0]
-            elif (len(maps_out)==4) and maps_out[:2]=='cl' and (maps_out[2:] in ["TT", "EE", "BB", "TE", "PP", "PT", "PE"]):
-                cl_arr, spin_arr = np.array([self.cl_dict[maps_out]]), [0]
-            elif maps_out=='TEB': # the cl_arr has to be in a specific order; we enforce by hand that the two other cross spectra TB and EB are zero
-                cl_arr, spin_arr = np.array([self.cl_dict["clTT"], self.cl_dict["clTE"], np.zeros_like(self.cl_dict["clTE"]), self.cl_dict["clEE"], np.zeros_like(self.cl_dict["clTE"]), self.cl_dict["clBB"]]), [0, 0, 0]
-            elif maps_out=='TQU': # the cl_arr has to be in a specific order; we enforce by hand that the two other cross spectra TB and EB are zero
-                cl_arr, spin_arr = np.array([self.cl_dict["clTT"], self.cl_dict["clTE"], np.zeros_like(self.cl_dict["clTE"]), self.cl_dict["clEE"], np.zeros_like(self.cl_dict["clTE"]), self.cl_dict["clBB"]]), [0, 2]
-            else:
+            cl_spin = self._cl_array(maps_out, self.cl_dict)
+            if cl_spin is None:
                 print("not a valid map specification")
                 return None
-            return self._flatmap(cl_arr, spin_arr, namaster_seed=namaster_seed)
+            return self._flatmap(*cl_spin, namaster_seed=namaster_seed)
         else:
             print("if you don't want to restrict to a `cl_dict` dictionary, use `self._flatmap` instead")
+
+    def flatmaps(self, maps_out, n_realizations=None, cl_dicts=None, seed=None, processes=1):
+        """
+        batch of flat-sky map realizations: n_realizations of self.cl_dict, or one realization of each of
+        cl_dicts. The array of power spectra that namaster needs is built once for each set of power spectra,
+        and every realization gets its own seed derived from `seed`, so the output does not depend on
+        the number of processes
+
+        Parameters
+        ----------
+        maps_out : str
+            map(s) that you would like to produce, as in flatmap
+        n_realizations : int, optional
+            number of realizations of self.cl_dict; ignored if cl_dicts is specified
+        cl_dicts : list of dict, optional
+            dictionaries of power spectra, e.g. the values of CAMBPowerSpectrum.results, of which to make one
+            realization each
+        seed : int, optional
+            seed from which the seed of every realization is derived with np.random.SeedSequence
+        processes : int, default 1
+            number of worker processes among which to divide the realizations
+
+        Returns
+        -------
+        np.ndarray
+            (N, Nm, Np, Np) array of N realizations of the Nm flat maps of flatmap
+        """
+        if cl_dicts is None:
+            if (self.cl_dict is None) or (n_realizations is None):
+                raise ValueError("specify cl_dicts, or n_realizations of self.cl_dict")
+            cl_dicts = [self.cl_dict]
+        else:
+            n_realizations = len(cl_dicts)
+        # the same dictionary (e.g. repeated for several realizations) gives the same array, which _synfast_chunk
+        # then only turns into Fourier amplitudes once
+        cl_spin_of = {}
+        for cl_dict in cl_dicts:
+            if id(cl_dict) not in cl_spin_of:
+                cl_spin_of[id(cl_dict)] = self._cl_array(maps_out, cl_dict)
+        cl_spins = [cl_spin_of[id(cl_dict)] for cl_dict in cl_dicts]
+        if cl_spins[0] is None:
+            raise ValueError(f"{maps_out} is not a valid map specification")
+        cl_arrays, spin_arr = [x[0] for x in cl_spins], cl_spins[0][1]
+        # namaster takes a non-negative C int as its seed
+        seeds = np.random.SeedSequence(seed).generate_state(n_realizations, dtype=np.uint32) % 2**31
+        geometry = (self.nx, self.ny, self.lx_rad, self.ly_rad)
+
+        first = _synfast_chunk(geometry, cl_arrays[:1], spin_arr, seeds[:1])
+        out = np.empty((n_realizations,) + first.shape[1:], dtype=first.dtype)
+        out[0] = first[0]
+        # realization i uses the power spectra cl_arrays[i], or cl_arrays[0] if there is only one set
+        chunks = [c for c in np.array_split(np.arange(1, n_realizations), max(1, processes)) if len(c) > 0]
+        chunk_cls = lambda c: cl_arrays[:1] if len(cl_arrays) == 1 else [cl_arrays[i] for i in c]
+        if processes > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [(c, pool.submit(_synfast_chunk, geometry, chunk_cls(c), spin_arr, seeds[c])) for c in chunks]
+                for c, future in futures:
+                    out[c] = future.result()
+        else:
+            for c in chunks:
+                _synfast_chunk(geometry, chunk_cls(c), spin_arr, seeds[c], out=out[c[0]:c[-1] + 1])
+        return out
+
+
+def _synfast_chunk(geometry, cl_arrays, spin_arr, seeds, out=None):
+    """
+    realizations of flat-sky maps with namaster (or flatsky if namaster is not installed), one for each seed;
+    the realizations share cl_arrays[0] if there is only one array of power spectra. Without namaster, the
+    Fourier amplitudes of one array of power spectra are held at a time, and reused for as long as the next
+    realization has the same array (the same object)
+
+    Parameters
+    ----------
+    geometry : tuple
+        (nx, ny, lx_rad, ly_rad) of flatmap
+    cl_arrays : list of np.ndarray
+        arrays of power spectra in the order expected by namaster
+    spin_arr : list of int
+        spins of the maps
+    seeds : np.ndarray
+        seed of each realization
+    out : np.ndarray, optional
+        array into which to write the maps
+
+    Returns
+    -------
+    np.ndarray
+        (len(seeds), Nm, Np, Np) array of maps
+    """
+    nx, ny, lx_rad, ly_rad = geometry
+    generator, generator_cls = None, None
+    for i, namaster_seed in enumerate(seeds):
+        cl_arr = cl_arrays[0] if len(cl_arrays) == 1 else cl_arrays[i]
+        if nmt is not None:
+            maps = nmt.synfast_flat(nx, ny, lx_rad, ly_rad, cl_arr, spin_arr, seed=int(namaster_seed))
+        else:
+            if cl_arr is not generator_cls:
+                generator, generator_cls = None, None  # free the previous amplitudes before computing the next
+                generator, generator_cls = flatsky.FlatSkyGenerator(nx, ny, lx_rad, ly_rad, cl_arr, spin_arr), cl_arr
+            maps = generator.draw(seed=int(namaster_seed))[0]
+        if out is None:
+            out = np.empty((len(seeds),) + maps.shape, dtype=maps.dtype)
+        out[i] = maps
+    return out
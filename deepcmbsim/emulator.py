@@ -0,0 +1,228 @@
+"""
+fast emulator of CAMBPowerSpectrum.get_cls, fit to a sweep written by CAMBPowerSpectrum.loop_sims, which returns
+power spectra in milliseconds on a CPU. Each spectrum is compressed with a principal component analysis, and the
+principal component coefficients are interpolated across the swept parameters with polyharmonic radial basis
+functions
+"""
+
+import numpy as np
+from deepcmbsim.sweep_io import SweepDataset
+
+
+class _SpectrumBasis:
+    """
+    principal component basis of one kind of power spectrum; auto spectra, which are never negative, are
+    compressed in log space (except at multipoles where they vanish, e.g. l < 2), which makes them much closer to
+    linear in the parameters
+    """
+    def __init__(self, cls, n_components):
+        self.log = np.all(cls > 0, axis=0) & np.all(cls >= 0)
+        x = self._forward(cls)
+        self.mean, self.scale = x.mean(axis=0), x.std(axis=0)
+        self.scale[self.scale == 0] = 1.
+        _, _, vt = np.linalg.svd((x - self.mean) / self.scale, full_matrices=False)
+        self.components = vt[:n_components]
+
+    def _forward(self, cls):
+        return np.where(self.log, np.log(np.where(self.log, cls, 1.)), cls)
+
+    def transform(self, cls):
+        return ((self._forward(cls) - self.mean) / self.scale) @ self.components.T
+
+    def inverse_transform(self, coefficients):
+        x = coefficients @ self.components * self.scale + self.mean
+        return np.where(self.log, np.exp(np.where(self.log, x, 0.)), x)
+
+
+class _RBFInterpolator:
+    """
+    interpolator with the polyharmonic kernel |x - y|^3 and a linear polynomial tail, which has no shape
+    parameter to tune and reproduces linear functions exactly
+    """
+    def __init__(self, x, y, smoothing=0.):
+        self.x = x
+        n, d = x.shape
+        kernel = self._kernel(x, x) + smoothing * np.eye(n)
+        polynomial = np.column_stack([np.ones(n), x])
+        system = np.block([[kernel, polynomial], [polynomial.T, np.zeros((d + 1, d + 1))]])
+        rhs = np.concatenate([y, np.zeros((d + 1, y.shape[1]))])
+        self.weights = np.linalg.lstsq(system, rhs, rcond=None)[0]
+
+    @staticmethod
+    def _kernel(x, y):
+        return np.linalg.norm(x[:, None, :] - y[None, :, :], axis=-1) ** 3
+
+    def __call__(self, x):
+        return np.column_stack([self._kernel(x, self.x), np.ones(len(x)), x]) @ self.weights
+
+
+class SpectrumEmulator:
+    """
+    emulator with the same get_cls interface as CAMBPowerSpectrum, for the parameters that were swept
+
+    Attributes
+    ----------
+    param_names : list of str
+        names of the emulated parameters, e.g. 'InitPower.r', in the order expected by predict
+    spectra : list of str
+        names of the emulated power spectra
+    l : np.ndarray
+        multipoles of the emulated power spectra
+    current_params : dict
+        values of the parameters used by get_cls, which are changed with update_val and start at the center
+        of the training range
+    accuracy : dict
+        accuracy on the held-out runs (see validate), or None if no runs were held out
+    results, result_parameters : dict
+        filled by get_cls(save_to_dict=...) as in CAMBPowerSpectrum
+    """
+    def __init__(self, params, cls, param_names, spectra, l, n_components=16, smoothing=0.):
+        """
+        Parameters
+        ----------
+        params : np.ndarray
+            (n_runs, n_params) array of the swept parameters of the training runs
+        cls : np.ndarray
+            (n_runs, n_spectra, n_l) array of the power spectra of the training runs
+        param_names : list of str
+            names of the swept parameters
+        spectra : list of str
+            names of the power spectra
+        l : array_like
+            multipoles of the power spectra
+        n_components : int, default 16
+            number of principal components kept for each kind of power spectrum
+        smoothing : float, default 0
+            regularization of the interpolation; 0 interpolates the training runs exactly
+        """
+        self.param_names, self.spectra, self.l = list(param_names), list(spectra), np.asarray(l)
+        params = np.asarray(params, dtype=float)
+        self._low, self._high = params.min(axis=0), params.max(axis=0)
+        n_components = min(n_components, len(params))
+        self._bases = [_SpectrumBasis(cls[:, i], n_components) for i in range(len(self.spectra))]
+        coefficients = np.concatenate([basis.transform(cls[:, i]) for i, basis in enumerate(self._bases)], axis=1)
+        self._split = np.cumsum([len(basis.components) for basis in self._bases])[:-1]
+        self._interpolator = _RBFInterpolator(self._normalize(params), coefficients, smoothing=smoothing)
+        self.current_params = dict(zip(self.param_names, (self._low + self._high) / 2))
+        self.accuracy = None
+        self.results, self.result_parameters = {}, {}
+
+    @classmethod
+    def from_sweep(cls, path, spectra=None, n_components=16, smoothing=0., test_fraction=0.1, seed=0):
+        """
+        fits an emulator to a sweep file written by loop_sims(outfile=...) or sweep_io.merge_shards, holding out
+        some of the runs to measure its accuracy
+
+        Parameters
+        ----------
+        path : str
+            path to the sweep file
+        spectra : list of str, optional
+            power spectra to emulate; by default, every spectrum in the file
+        n_components : int, default 16
+            number of principal components kept for each kind of power spectrum
+        smoothing : float, default 0
+            regularization of the interpolation
+        test_fraction : float, default 0.1
+            fraction of the runs held out of the fit and used to measure the accuracy
+        seed : int, default 0
+            seed for the choice of the held-out runs
+
+        Returns
+        -------
+        SpectrumEmulator
+            with its accuracy on the held-out runs in the accuracy attribute
+        """
+        with SweepDataset(path, spectra=spectra) as dataset:
+            params, cls_array = dataset[np.arange(len(dataset))]
+            param_names, spectra, l = dataset.param_names, dataset.spectra, dataset.l
+        order = np.random.default_rng(seed).permutation(len(params))
+        n_test = int(round(test_fraction * len(params)))
+        test, train = order[:n_test], order[n_test:]
+        emulator = cls(params[train], cls_array[train], param_names, spectra, l, n_components=n_components,
+                       smoothing=smoothing)
+        if n_test > 0:
+            emulator.accuracy = emulator.validate(params[test], cls_array[test])
+        return emulator
+
+    def _normalize(self, params):
+        return (params - self._low) / np.where(self._high > self._low, self._high - self._low, 1.)
+
+    def predict(self, params):
+        """
+        Parameters
+        ----------
+        params : array_like
+            (n, n_params) array of parameters in the order of param_names
+
+        Returns
+        -------
+        np.ndarray
+            (n, n_spectra, n_l) array of emulated power spectra
+        """
+        params = np.atleast_2d(np.asarray(params, dtype=float))
+        coefficients = np.split(self._interpolator(self._normalize(params)), self._split, axis=1)
+        return np.stack([basis.inverse_transform(c) for basis, c in zip(self._bases, coefficients)], axis=1)
+
+    def validate(self, params, cls):
+        """
+        compares the emulator with power spectra computed by CAMB
+
+        Parameters
+        ----------
+        params : np.ndarray
+            (n, n_params) array of parameters in the order of param_names
+        cls : np.ndarray
+            (n, n_spectra, n_l) array of the corresponding power spectra
+
+        Returns
+        -------
+        dict
+            for each spectrum, the maximum and root-mean-square over runs and multipoles of the error relative
+            to the largest absolute value of that spectrum in each run
+        """
+        error = self.predict(params) - cls
+        relative = error / np.maximum(np.abs(cls).max(axis=-1, keepdims=True), np.finfo(float).tiny)
+        return {k: {'max_fractional_error': float(np.abs(relative[:, i]).max()),
+                    'rms_fractional_error': float(np.sqrt(np.mean(relative[:, i] ** 2)))}
+                for i, k in enumerate(self.spectra)}
+
+    def update_val(self, attr, new_val):
+        """
+        Parameters
+        ----------
+        attr : str
+            name of an emulated parameter, e.g. 'InitPower.r'
+        new_val : float
+            new value of the parameter
+        """
+        if attr not in self.current_params:
+            raise ValueError(f"{attr} is not emulated; the emulated parameters are {self.param_names}")
+        if not self._low[self.param_names.index(attr)] <= new_val <= self._high[self.param_names.index(attr)]:
+            print(f"{attr} = {new_val} is outside of the range of the training runs; the emulator is extrapolating")
+        self.current_params[attr] = new_val
+
+    def get_cls(self, save_to_dict=None, user_params=True):
+        """
+        emulated equivalent of CAMBPowerSpectrum.get_cls at current_params
+
+        Parameters
+        ----------
+        save_to_dict : str, optional
+            if specified, will populate the self.results dictionary with the output dictionary
+        user_params : bool, default True
+            accepted for compatibility with CAMBPowerSpectrum.get_cls; the saved parameters are always the
+            emulated parameters
+
+        Returns
+        -------
+        dict
+            dictionary of values of l and of the emulated power spectra
+        """
+        cls = self.predict([[self.current_params[k] for k in self.param_names]])[0]
+        outdict = {'l': self.l, **dict(zip(self.spectra, cls))}
+        if save_to_dict is not None:
+            self.results[save_to_dict] = outdict
+            self.result_parameters[save_to_dict] = dict(self.current_params)
+        else:
+            return outdict
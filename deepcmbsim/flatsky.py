@@ -0,0 +1,162 @@
+"""
+flat-sky Gaussian realizations of power spectra with FFTs, with the same inputs and statistics as
+pymaster.synfast_flat but no dependency beyond numpy (scipy.fft is used for multithreaded FFTs if it is
+installed)
+"""
+
+import functools
+import os
+import numpy as np
+
+
+@functools.lru_cache(maxsize=1)
+def _fft_backend():
+    """
+    (rfft2, irfft2) from scipy.fft with one worker per CPU if scipy is installed, and otherwise from numpy.fft
+    """
+    try:
+        import scipy.fft
+    except ModuleNotFoundError:
+        return np.fft.rfft2, np.fft.irfft2
+    workers = os.cpu_count()
+    return (functools.partial(scipy.fft.rfft2, workers=workers),
+            functools.partial(scipy.fft.irfft2, workers=workers))
+
+
+@functools.lru_cache(maxsize=8)
+def _geometry(nx, ny, lx_rad, ly_rad):
+    """
+    multipoles and polarization rotation kernels of the Fourier modes of an (ny, nx) map, which are shared by
+    every realization with the same geometry
+
+    Returns
+    -------
+    tuple
+        (ell_unique, ell_index, cos_2phi, sin_2phi, pixel_area), where ell_unique holds the distinct
+        multipoles of the (ny, nx//2+1) grid of Fourier modes and ell_index maps the grid onto them
+    """
+    kx = 2 * np.pi * np.fft.rfftfreq(nx, d=lx_rad / nx)
+    ky = 2 * np.pi * np.fft.fftfreq(ny, d=ly_rad / ny)
+    kx, ky = np.meshgrid(kx, ky)
+    ell = np.sqrt(kx ** 2 + ky ** 2)
+    ell_unique, ell_index = np.unique(ell, return_inverse=True)
+    phi = np.arctan2(ky, kx)
+    out = (ell_unique, ell_index.reshape(ell.shape), np.cos(2 * phi), np.sin(2 * phi), lx_rad * ly_rad / (nx * ny))
+    for x in out[:-1]:
+        x.setflags(write=False)
+    return out
+
+
+class FlatSkyGenerator:
+    """
+    generator of flat-sky realizations of one set of power spectra, whose Fourier amplitudes are computed once
+    and reused for every draw
+
+    Attributes
+    ----------
+    nx, ny : int
+        number of pixels on the x and y axes
+    lx_rad, ly_rad : float
+        size of the map on the x and y axes, in radians
+    spin_arr : list of int
+        spin (0 or 2) of each field, as in pymaster.synfast_flat
+    n_maps : int
+        number of maps in each realization (1 for each spin-0 field, 2 for each spin-2 field)
+    """
+    def __init__(self, nx, ny, lx_rad, ly_rad, cls, spin_arr):
+        """
+        Parameters
+        ----------
+        nx, ny : int
+            number of pixels on the x and y axes
+        lx_rad, ly_rad : float
+            size of the map on the x and y axes, in radians
+        cls : array_like
+            power spectra (starting at l=0) in the order of pymaster.synfast_flat, i.e. the upper triangle, row
+            by row, of the matrix of power spectra of the map components, where each spin-2 field has an E and
+            a B component; e.g. [TT, TE, TB, EE, EB, BB] for spin_arr [0, 2]
+        spin_arr : list of int
+            spin (0 or 2) of each field
+        """
+        self.nx, self.ny, self.lx_rad, self.ly_rad = int(nx), int(ny), float(lx_rad), float(ly_rad)
+        self.spin_arr = list(spin_arr)
+        self.n_maps = sum(1 if spin == 0 else 2 for spin in self.spin_arr)
+        cls = np.atleast_2d(np.asarray(cls, dtype=float))
+        if len(cls) != self.n_maps * (self.n_maps + 1) // 2:
+            raise ValueError(f"{len(cls)} power spectra given, but spins {self.spin_arr} need "
+                             f"{self.n_maps * (self.n_maps + 1) // 2}")
+        ell_unique, ell_index, self._cos_2phi, self._sin_2phi, pixel_area = \
+            _geometry(self.nx, self.ny, self.lx_rad, self.ly_rad)
+
+        # covariance of the map components at every distinct multipole of the grid, and its square root
+        covariance = np.zeros((len(ell_unique), self.n_maps, self.n_maps))
+        rows, cols = np.triu_indices(self.n_maps)
+        for cl, i, j in zip(cls, rows, cols):
+            covariance[:, i, j] = covariance[:, j, i] = np.interp(ell_unique, np.arange(len(cl)), cl, right=0.)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        amplitude = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))[:, None, :]
+        # white noise with unit variance in each pixel has variance nx*ny in each Fourier mode
+        self._amplitude = np.moveaxis((amplitude / np.sqrt(pixel_area))[ell_index], (2, 3), (0, 1))  # (n, n, ny, nx//2+1)
+
+    def draw(self, n_realizations=1, seed=None, out=None):
+        """
+        Parameters
+        ----------
+        n_realizations : int, default 1
+            number of realizations
+        seed : int or np.random.SeedSequence, optional
+            seed of the white noise
+        out : np.ndarray, optional
+            array of shape (n_realizations, n_maps, ny, nx) into which to write the maps
+
+        Returns
+        -------
+        np.ndarray
+            (n_realizations, n_maps, ny, nx) array of maps, where each spin-2 field is given as its Q and U maps
+        """
+        rfft2, irfft2 = _fft_backend()
+        white = np.random.default_rng(seed).standard_normal((n_realizations, self.n_maps, self.ny, self.nx))
+        white_k = rfft2(white)
+        # correlate the components: fields_k[n, i] = sum_j amplitude[i, j] white_k[n, j] at every Fourier mode
+        fields_k = np.zeros_like(white_k)
+        for i in range(self.n_maps):
+            for j in range(self.n_maps):
+                if np.any(self._amplitude[i, j]):
+                    fields_k[:, i] += self._amplitude[i, j] * white_k[:, j]
+        i = 0
+        for spin in self.spin_arr:
+            if spin == 2:  # rotate E and B into Q and U
+                e_k, b_k = fields_k[:, i].copy(), fields_k[:, i + 1].copy()
+                fields_k[:, i] = e_k * self._cos_2phi - b_k * self._sin_2phi
+                fields_k[:, i + 1] = e_k * self._sin_2phi + b_k * self._cos_2phi
+            i += 1 if spin == 0 else 2
+        maps = irfft2(fields_k, s=(self.ny, self.nx))
+        if out is None:
+            return maps
+        out[...] = maps
+        return out
+
+
+def synfast_flat(nx, ny, lx_rad, ly_rad, cls, spin_arr, seed=-1):
+    """
+    single flat-sky realization, with the signature and output of pymaster.synfast_flat
+
+    Parameters
+    ----------
+    nx, ny : int
+        number of pixels on the x and y axes
+    lx_rad, ly_rad : float
+        size of the map on the x and y axes, in radians
+    cls : array_like
+        power spectra in the order of pymaster.synfast_flat (see FlatSkyGenerator)
+    spin_arr : list of int
+        spin (0 or 2) of each field
+    seed : int, default -1
+        seed of the realization; negative for a random seed
+
+    Returns
+    -------
+    np.ndarray
+        (n_maps, ny, nx) array of maps
+    """
+    return FlatSkyGenerator(nx, ny, lx_rad, ly_rad, cls, spin_arr).draw(seed=seed if seed >= 0 else None)[0]
@@ -0,0 +1,136 @@
+"""
+streaming pipeline from a sweep of power spectra (see sweep_io) to a compressed hdf5 dataset of flat-sky maps
+for training. Runs are read, turned into maps, and written in fixed-size batches; a bounded queue between the
+map synthesis and the writer provides backpressure, so memory use does not grow with the size of the dataset
+"""
+
+import h5py
+import numpy as np
+from deepcmbsim.cl_plotting import flatmap
+from deepcmbsim.sweep_io import BackgroundWriter, SweepDataset
+
+
+def _cl_dict(spectra, l, cls):
+    """
+    dictionary of power spectra at every multipole from 0, as flatmap needs, from spectra stored at multipoles l
+    """
+    if np.array_equal(l, np.arange(len(l))):
+        return dict(zip(spectra, cls))
+    ells = np.arange(int(np.max(l)) + 1)
+    return {k: np.interp(ells, l, cl, left=0.) for k, cl in zip(spectra, cls)}
+
+
+def iter_maps(dataset, maps_out, pixels, degrees, realizations_per_run=1, batch_size=64, seed=None, processes=1):
+    """
+    iterates over the runs of a sweep in order, and yields flat-sky maps of their power spectra in batches
+
+    Parameters
+    ----------
+    dataset : SweepDataset
+        sweep of power spectra
+    maps_out : str
+        map(s) to make, as in flatmap.flatmap, e.g. 'TQU'
+    pixels : int
+        number of pixels on each side of a map
+    degrees : float
+        number of degrees on each side of a map
+    realizations_per_run : int, default 1
+        number of map realizations of each run
+    batch_size : int, default 64
+        number of runs in each batch
+    seed : int, optional
+        seed from which the seeds of the realizations of each batch are derived, so that the maps are
+        reproducible for the same seed and batch_size
+    processes : int, default 1
+        number of worker processes used by flatmap.flatmaps
+
+    Returns
+    -------
+    iterator
+        yields (start, params, maps) for each batch, where start is the index of its first run, params is
+        the (n, n_params) array of the swept parameters of each realization, and maps is the
+        (n, n_maps, pixels, pixels) array of maps, with n = realizations_per_run * (runs in the batch)
+    """
+    fm = flatmap(pixels, degrees)
+    for batch, start in enumerate(range(0, len(dataset), batch_size)):
+        params, cls = dataset[start:start + batch_size]
+        cl_dicts = [_cl_dict(dataset.spectra, dataset.l, run_cls) for run_cls in cls]
+        cl_dicts = [cl_dict for cl_dict in cl_dicts for _ in range(realizations_per_run)]
+        batch_seed = None if seed is None else [seed, batch]
+        maps = fm.flatmaps(maps_out, cl_dicts=cl_dicts, seed=batch_seed, processes=processes)
+        yield start, np.repeat(params, realizations_per_run, axis=0), maps
+
+
+def write_map_dataset(sweep_path, outfile, maps_out, pixels, degrees, realizations_per_run=1, batch_size=64,
+                      seed=None, processes=1, dtype='f4', compression='gzip', queue_size=2):
+    """
+    makes flat-sky maps of every run of a sweep and writes them to a single hdf5 file, with the maps of each
+    batch written by a background thread while the next batch is being made
+
+    The file holds `maps`, a chunked and compressed (n, n_maps, pixels, pixels) dataset with one chunk per map
+    realization, and, aligned with it, `parameters` (the swept parameters, as in the sweep file), `run_id`
+    (the run of the sweep from which each map was made) and `realization` (the index of the realization of
+    that run)
+
+    Parameters
+    ----------
+    sweep_path : str
+        path to a sweep file written by SweepWriter
+    outfile : str
+        path of the hdf5 file of maps
+    maps_out : str
+        map(s) to make, as in flatmap.flatmap, e.g. 'TQU'
+    pixels : int
+        number of pixels on each side of a map
+    degrees : float
+        number of degrees on each side of a map
+    realizations_per_run : int, default 1
+        number of map realizations of each run
+    batch_size : int, default 64
+        number of runs that are turned into maps at a time
+    seed : int, optional
+        seed of the map realizations (see iter_maps)
+    processes : int, default 1
+        number of worker processes used to make the maps
+    dtype : str, default 'f4'
+        data type in which the maps are stored
+    compression : str, default 'gzip'
+        hdf5 compression filter of the maps, or None
+    queue_size : int, default 2
+        maximum number of batches of maps waiting to be written; making maps pauses when the queue is full, so at
+        most queue_size + 2 batches are held in memory
+
+    Returns
+    -------
+    None
+    """
+    # the runs are read in order, so a small chunk cache suffices
+    with SweepDataset(sweep_path, cache_mb=16) as dataset, h5py.File(outfile, 'w') as f:
+        cl_spin = flatmap._cl_array(maps_out, {k: np.zeros(1) for k in dataset.spectra})
+        if cl_spin is None:
+            raise ValueError(f"{maps_out} is not a valid map specification for the spectra {dataset.spectra}")
+        n_maps = sum(1 if spin == 0 else 2 for spin in cl_spin[1])
+        n = len(dataset) * realizations_per_run
+        f.create_dataset('maps', shape=(n, n_maps, pixels, pixels), dtype=dtype,
+                         chunks=(1, n_maps, pixels, pixels), compression=compression, shuffle=compression is not None)
+        param_dtype = np.dtype([(name, 'f8') for name in dataset.param_names])
+        f.create_dataset('parameters', shape=(n,), dtype=param_dtype)
+        f.create_dataset('run_id', shape=(n,), dtype=h5py.string_dtype())
+        f.create_dataset('realization', shape=(n,), dtype='i8')
+        f.attrs.update({'maps_out': maps_out, 'pixels': pixels, 'degrees': degrees, 'sweep': sweep_path})
+
+        def write(batch):
+            start, params, maps = batch
+            stop = start + len(maps)
+            f['maps'][start:stop] = maps
+            f['parameters'][start:stop] = np.rec.fromarrays(params.T, dtype=param_dtype)
+            f['run_id'][start:stop] = np.repeat(dataset.run_ids(slice(start // realizations_per_run,
+                                                                      stop // realizations_per_run)),
+                                                realizations_per_run).astype(object)
+            f['realization'][start:stop] = np.arange(start, stop) % realizations_per_run
+
+        with BackgroundWriter(write, queue_size=queue_size) as writer:
+            for start, params, maps in iter_maps(dataset, maps_out, pixels, degrees,
+                                                 realizations_per_run=realizations_per_run, batch_size=batch_size,
+                                                 seed=seed, processes=processes):
+                writer.put((start * realizations_per_run, params, maps))
@@ -1,3 +1,4 @@
+import functools
 import numpy as np
 """
 noise module that implements Eq 8 of astro-ph/0111606 (Hu and Okamoto Astrophys.J. 574 (2002) 566-574)
@@ -26,6 +27,60 @@ def max_multipole(beamfwhm_arcmin, additional_factor=3):
     """
     return 180 * 60 * additional_factor / beamfwhm_arcmin
 
+def _detector_white_noise_batch(noise_uKarcmin, beamfwhm_arcmin, lmax, units_uK):
+    """
+    implementation of detector_white_noise_batch for 1d arrays of (broadcast) noise levels and beams
+    """
+    noise_fields = np.stack([noise_uKarcmin, noise_uKarcmin * np.sqrt(2)], axis=-1)  # TT, then EE/BB
+    noise_fields = noise_fields if units_uK else noise_fields / 2.72548e6
+    ells = np.arange(lmax + 1)
+    # the inverse of the gaussian beam window, which is shared by both fields
+    inverse_beam = np.exp(np.outer((beamfwhm_arcmin * arcmin_to_rad) ** 2 / (8 * np.log(2)), ells * (ells + 1)))
+    return (noise_fields * arcmin_to_rad)[:, :, None] ** 2 * inverse_beam[:, None, :]
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_detector_white_noise_batch(noise_uKarcmin, beamfwhm_arcmin, lmax, units_uK):
+    out = _detector_white_noise_batch(np.array(noise_uKarcmin), np.array(beamfwhm_arcmin), lmax, units_uK)
+    out.setflags(write=False)  # shared between every caller that asks for the same configurations
+    return out
+
+
+def detector_white_noise_batch(noise_uKarcmin, beamfwhm_arcmin, lmax, units_uK=True, cache=True):
+    """
+    detector_white_noise for many instrument configurations at once, e.g. to add many noise levels and beams to
+    a single noiseless power spectrum. Results are cached by (noise_uKarcmin, beamfwhm_arcmin, lmax, units_uK)
+    unless cache is False
+
+    Parameters
+    ----------
+    noise_uKarcmin : float or array_like
+        noise levels of the temperature maps in units of microKelvin*arcminutes
+    beamfwhm_arcmin : float or array_like
+        the full width at half maximum of the beams in the Gaussian approximation, in units of arcminutes;
+        broadcast against noise_uKarcmin
+    lmax : int
+        maximum multipole to which to calculate
+    units_uK : bool, default True
+        whether or not to return the units in microKelvin (default) or dimensionless
+    cache : bool, default True
+        whether to cache the result, which is worthwhile unless the configurations are different every time
+
+    Returns
+    -------
+    np.ndarray
+        array (read-only if cache is True) of shape (n_configs, 2, lmax+1), where n_configs is the broadcast size
+        of noise_uKarcmin and beamfwhm_arcmin, with the noise for the TT power spectrum and for the polarization
+        power spectra
+    """
+    noise_uKarcmin, beamfwhm_arcmin = np.broadcast_arrays(np.atleast_1d(np.asarray(noise_uKarcmin, dtype=float)),
+                                                          np.atleast_1d(np.asarray(beamfwhm_arcmin, dtype=float)))
+    if not cache:
+        return _detector_white_noise_batch(noise_uKarcmin.ravel(), beamfwhm_arcmin.ravel(), int(lmax), bool(units_uK))
+    return _cached_detector_white_noise_batch(tuple(noise_uKarcmin.ravel().tolist()),
+                                              tuple(beamfwhm_arcmin.ravel().tolist()), int(lmax), bool(units_uK))
+
+
 def detector_white_noise(noise_uKarcmin, beamfwhm_arcmin, lmax, TT=True, units_uK = True):
     """
     describes white (no angular scale) noise from a detector
@@ -49,9 +104,7 @@ def detector_white_noise(noise_uKarcmin, beamfwhm_arcmin, lmax, TT=True, units_u
     Returns
     -------
     np.ndarray
-        provides noise for the TT power spectrum or polarization power spectra in an array of length lmax+1
+        provides noise for the TT power spectrum or polarization power spectra in a new array of length lmax+1
     """
-    noise_uKarcmin = noise_uKarcmin if TT else noise_uKarcmin * np.sqrt(2)
-    noise_uKarcmin = noise_uKarcmin if units_uK else noise_uKarcmin / 2.72548e6
-    ells = np.arange(lmax+1)
-    return (noise_uKarcmin * arcmin_to_rad) ** 2 * np.exp(ells * (ells + 1) * (beamfwhm_arcmin * arcmin_to_rad) ** 2 / (8 * np.log(2)))
\ No newline at end of file
+    # a copy, since the cached array is shared with every other caller
+    return detector_white_noise_batch(noise_uKarcmin, beamfwhm_arcmin, lmax, units_uK=units_uK)[0, 0 if TT else 1].copy()
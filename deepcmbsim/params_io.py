@@ -1,4 +1,9 @@
 import camb
+from camb.baseconfig import CAMB_Structure
+import copy
+import ctypes
+import functools
+import json
 import yaml
 import numpy as np
 import re
@@ -46,6 +51,30 @@ def _quick_yaml_load(infile):
         return yaml.safe_load(f)
 
 
+@functools.lru_cache(maxsize=16)
+def _cached_yaml_load(infile, mtime):
+    return _quick_yaml_load(infile)
+
+
+def _load_config(infile):
+    """
+    _quick_yaml_load, cached for as long as infile is not modified; returns a copy that the caller may change
+    """
+    return copy.deepcopy(_cached_yaml_load(os.path.abspath(infile), os.path.getmtime(infile)))
+
+
+@functools.lru_cache(maxsize=8)
+def _camb_params_template(base_camb_params_json):
+    """
+    CAMBparams instance with every attribute in a json-encoded BASECAMBPARAMS dictionary set, which is built once
+    for each distinct dictionary; config_obj uses copies of it
+    """
+    cambparams_instance = camb.CAMBparams()
+    for x, y in json.loads(base_camb_params_json).items():
+        _set_camb_attr(cambparams_instance, x, y)
+    return cambparams_instance
+
+
 class config_obj:
     """
     configuration object that is used to obtain power spectra
@@ -60,11 +89,19 @@ class config_obj:
     dict_iterables : dict
         a dictionary of all of the iterables that the user has specified, which will be made
         available to loop over in camb_power_spectrum.CAMBPowerSpectrum
+    user_config, base_config : str
+        paths to the yaml files from which this object was built
+    updates : dict
+        every value changed through update_val since the yaml files were loaded, which together with
+        user_config and base_config is enough to rebuild an identical config_obj (e.g. in a worker process)
     """
     def __init__(
             self,
             user_config=os.path.join(os.path.dirname(__file__), "settings", "user_config.yaml"),
-            base_config=os.path.join(os.path.dirname(__file__), "settings", "base_config.yaml")
+            base_config=os.path.join(os.path.dirname(__file__), "settings", "base_config.yaml"),
+            shard_index=None,
+            shard_count=None,
+            accuracy_preset=None
     ):
         """
 
@@ -76,22 +113,30 @@ class config_obj:
             path to yaml file that contains baseline cosmological parameters that reflect the best-fit
             2018 Planck cosmology and which instruct CAMB to calculate useful observables. A full list
             is available at https://camb.readthedocs.io/en/latest/model.html
+        shard_index, shard_count : int, optional
+            if specified, overwrite `shard_index` and `shard_count` in user_config, which select the slice
+            of the ITERABLES grid that is computed by CAMBPowerSpectrum.loop_sims
+        accuracy_preset : str, optional
+            if specified, overwrites `accuracy_preset` in user_config: one of presets.PRESETS ('fast-training',
+            'default' or 'high-precision'), from which CAMBPowerSpectrum derives extra_l, max_eta_k and the
+            Accuracy boosts for its multipole range
         """
+        self.user_config, self.base_config = user_config, base_config
+        self.updates = {}
+
         self._all_params_dict = {
-            'USERPARAMS': _quick_yaml_load(user_config),
-            'BASECAMBPARAMS': _quick_yaml_load(base_config)
+            'USERPARAMS': _load_config(user_config),
+            'BASECAMBPARAMS': _load_config(base_config)
         }
 
-        self.CAMBparams = camb.CAMBparams()  # creates a base CAMBparams instance
-
         if 'FORCAMB' in self._all_params_dict['USERPARAMS']:  # overwrite BASECAMBPARAMS if anything specified
             self._all_params_dict['BASECAMBPARAMS'] = {
                 **self._all_params_dict['BASECAMBPARAMS'],
                 **self._all_params_dict['USERPARAMS']['FORCAMB']
             }
 
-        for x, y in self._all_params_dict['BASECAMBPARAMS'].items():
-            _set_camb_attr(self.CAMBparams, x, y)
+        # copy a cached CAMBparams instance rather than setting every attribute of a new one
+        self.CAMBparams = _camb_params_template(json.dumps(self._all_params_dict['BASECAMBPARAMS'])).copy()
 
         if len(self._all_params_dict['USERPARAMS']) > 0:
             try:
@@ -110,6 +155,11 @@ class config_obj:
 
         self.dict_iterables = self._all_params_dict['USERPARAMS']['ITERABLES']  # make this more easily accessible
 
+        for x, y in [('shard_index', shard_index), ('shard_count', shard_count), ('accuracy_preset', accuracy_preset)]:
+            if y is not None:
+                self.UserParams[x] = y
+                self.updates[x] = y
+
 
     def update_val(self, attr, new_val, verbose=True):
         """
@@ -121,7 +171,7 @@ class config_obj:
         new_val : float
             new value that you wish attr to take on
         """
-        attr_split = re.split("\.", attr)
+        attr_split = re.split("\\.", attr)
         if (len(attr_split) == 1) and (hasattr(self.CAMBparams, attr)):
             setattr(self.CAMBparams, attr, new_val)
             if verbose:
@@ -137,6 +187,8 @@ class config_obj:
                 print(f"updated {attr} in UserParams to {new_val}")
         else:
             print("not a valid attribute")
+            return
+        self.updates[attr] = new_val
 
     def camb_params_to_dict(self, user_params=True):
         """
@@ -159,50 +211,77 @@ class config_obj:
             return cpd
 
 
-def _strconvert(x):
-    try:
-        return eval(x)
-    except NameError:
-        return x.replace(" ", "")
+_PLAIN_TYPES = {bool, int, float, str, type(None)}
+
+
+@functools.lru_cache(maxsize=None)
+def _camb_fields(camb_class):
+    """
+    names of the fields of a CAMB structure class, including those of its base classes
+    """
+    return [name for name, _ in camb_class.get_all_fields()]
+
+
+def _camb_value(obj):
+    """
+    converts the value of a field of a CAMB structure into plain python types
+    """
+    if type(obj) in _PLAIN_TYPES:  # the vast majority of fields, so check these first
+        return obj
+    elif isinstance(obj, CAMB_Structure):
+        return _camb_params_to_dict(obj)
+    elif isinstance(obj, (ctypes.Array, np.ndarray, list)):
+        return [_camb_value(x) for x in obj]
+    elif isinstance(obj, ctypes.c_void_p):
+        return obj.value
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    else:
+        return obj
 
 
 def _camb_params_to_dict(cambparams_instance):
-    _long_str = str(cambparams_instance)
-    _long_str_lines = re.split("\\n", _long_str)[1:]  # first entry is just 'class: <CAMBparams>'
-    outer_dict = {}
-    i = 0
-    while i < len(_long_str_lines):
-        _line = _long_str_lines[i]
-        _line2 = re.split("=", _line)
-        if len(_line2) > 1:
-            outer_dict[_line2[0].replace(" ", "")] = _strconvert(_line2[1])
-        elif len(_line) > 1:
-            _line = re.split(":", _line)[0]
-            inner_dict = {}
-            while i < len(_long_str_lines):
-                i += 1
-                if _long_str_lines[i][:3] == '   ':
-                    _line3 = re.split("=", _long_str_lines[i])
-                    inner_dict[_line3[0].replace(" ", "")] = _strconvert(_line3[1]) if "None" not in _line3[1] else "~"
-                else:
-                    i -= 1
-                    break
-            outer_dict[_line.replace(" ", "")] = inner_dict
-        i += 1
-    return outer_dict
+    """
+    typed dictionary of every field of a CAMBparams instance (or any other CAMB structure), built by walking
+    the fields of the structure directly; nested structures such as InitPower become nested dictionaries
+    Parameters
+    ----------
+    cambparams_instance : CAMBparams instance
+        this must be instantiated by calling CAMB
+    Returns
+    -------
+    dict
+        dictionary of bools, ints, floats, strings, lists, and None, in the format of base_config.yaml,
+        from which camb_params_from_dict can rebuild an equivalent CAMBparams instance
+    """
+    return {name: _camb_value(getattr(cambparams_instance, name)) for name in _camb_fields(type(cambparams_instance))}
+
+
+def camb_params_from_dict(camb_params_dict):
+    """
+    rebuilds a CAMBparams instance from a dictionary in the format of base_config.yaml, e.g. the output of
+    config_obj.camb_params_to_dict(user_params=False)
+    Parameters
+    ----------
+    camb_params_dict : dict
+        dictionary of CAMBparams attributes; nested attributes are given as nested dictionaries
+    Returns
+    -------
+    CAMBparams instance
+    """
+    cambparams_instance = camb.CAMBparams()
+    for x, y in camb_params_dict.items():
+        _set_camb_attr(cambparams_instance, x, y)
+    return cambparams_instance
 
 
 def _nested_dict_diff(d1, d2):
     diff_dict = {}
     for k, v in d1.items():
-        if k in d2.keys():
-            if type(v) == dict:
-                for k_inner, v_inner in v.items():
-                    if d2[k][k_inner] != v_inner:
-                        diff_dict[k] = {k_inner: v_inner}
-            else:
-                if d2[k] != v:
-                    diff_dict[k] = v
-        else:
+        if isinstance(v, dict) and isinstance(d2.get(k), dict):
+            inner_diff = _nested_dict_diff(v, d2[k])
+            if len(inner_diff) > 0:
+                diff_dict[k] = inner_diff
+        elif (k not in d2) or (d2[k] != v):
             diff_dict[k] = v
     return diff_dict
@@ -0,0 +1,153 @@
+"""
+named accuracy/speed presets for the CAMB settings that limit the cost of a calculation, which are derived from the
+multipole range rather than pinned at the values in base_config.yaml, and a tool that measures the error and the
+runtime of each preset against a high-accuracy reference
+
+usage (from the top-level directory):
+    python -m deepcmbsim.presets --max_l_use 2000
+"""
+
+import argparse
+import time
+import numpy as np
+
+# each preset sets, for a calculation up to max_l_use,
+#   max_l = max_l_use + extra_l, since lensing moves power between multipoles and CAMB's errors affect the last
+#           hundred or so multipoles,
+#   max_eta_k = max(k_eta_factor * max_l, lens_k_eta), as in CAMBparams.set_for_lmax; the lensing potential, and
+#           so the lensed BB, needs lens_k_eta of about 18000 (lens_potential_accuracy=1) whatever max_l is,
+#   max_l_tensor = min(max_l, tensor_l_max) and max_eta_k_tensor = k_eta_factor * max_l_tensor, since the tensor
+#           spectra are negligible beyond a few hundred (None computes them up to max_l),
+#   and the Accuracy boosts
+PRESETS = {
+    'fast-training': {'extra_l': 150, 'k_eta_factor': 2.5, 'lens_k_eta': 9000., 'tensor_l_max': 600,
+                      'AccuracyBoost': 1.0, 'lAccuracyBoost': 1.0, 'lSampleBoost': 1.0},
+    'default': {'extra_l': 300, 'k_eta_factor': 2.5, 'lens_k_eta': 18000., 'tensor_l_max': 1500,
+                'AccuracyBoost': 1.0, 'lAccuracyBoost': 1.0, 'lSampleBoost': 1.0},
+    'high-precision': {'extra_l': 600, 'k_eta_factor': 5., 'lens_k_eta': 36000., 'tensor_l_max': None,
+                       'AccuracyBoost': 1.5, 'lAccuracyBoost': 1.5, 'lSampleBoost': 1.5},
+}
+
+# settings of the reference against which validate_presets measures the error of each preset
+REFERENCE = {'extra_l': 1000, 'k_eta_factor': 10., 'lens_k_eta': 54000., 'tensor_l_max': None,
+             'AccuracyBoost': 2.0, 'lAccuracyBoost': 2.0, 'lSampleBoost': 2.0}
+
+
+def preset_settings(preset, max_l_use):
+    """
+    Parameters
+    ----------
+    preset : str or dict
+        name of one of PRESETS, or a dictionary with the same keys
+    max_l_use : int
+        largest multipole that will be used
+
+    Returns
+    -------
+    dict
+        extra_l, and the values of the CAMBparams attributes max_l, max_l_tensor, max_eta_k, max_eta_k_tensor
+        and Accuracy (a dictionary of boosts) that the preset sets for this multipole range, in the format of
+        base_config.yaml
+    """
+    if isinstance(preset, str):
+        if preset not in PRESETS:
+            raise ValueError(f"accuracy_preset must be one of {list(PRESETS)}, not {preset}")
+        preset = PRESETS[preset]
+    max_l = int(max_l_use + preset['extra_l'])
+    max_l_tensor = max_l if preset['tensor_l_max'] is None else min(max_l, int(preset['tensor_l_max']))
+    return {'extra_l': int(preset['extra_l']), 'max_l': max_l, 'max_l_tensor': max_l_tensor,
+            'max_eta_k': float(max(preset['k_eta_factor'] * max_l, preset['lens_k_eta'])),
+            'max_eta_k_tensor': float(preset['k_eta_factor'] * max_l_tensor),
+            'Accuracy': {k: float(preset[k]) for k in ['AccuracyBoost', 'lAccuracyBoost', 'lSampleBoost']}}
+
+
+def fractional_errors(cls, reference, l_min=2):
+    """
+    Parameters
+    ----------
+    cls, reference : dict
+        outputs of CAMBPowerSpectrum.get_cls over the same multipoles
+    l_min : int, default 2
+        smallest multipole compared
+
+    Returns
+    -------
+    dict
+        for each spectrum, the maximum over multipoles of |cls - reference| / reference; the cross spectra cross
+        zero, so the error of clTE is relative to sqrt(clTT clEE), and those of clPT and clPE (which CAMB returns
+        in other units than clTT and clEE) to their largest absolute value
+    """
+    reference = {k: np.asarray(v) for k, v in reference.items()}
+    keep = reference['l'] >= l_min
+    out = {}
+    for k in reference:
+        if (k == 'l') or (k not in cls):
+            continue
+        if (k == 'clTE') and ('clTT' in reference) and ('clEE' in reference):
+            scale = np.sqrt(np.abs(reference['clTT'] * reference['clEE']))
+        elif k in ['clTE', 'clPT', 'clPE']:
+            scale = np.full(len(keep), np.abs(reference[k][keep]).max())
+        else:
+            scale = np.abs(reference[k])
+        error = np.abs(np.asarray(cls[k]) - reference[k])[keep] / np.maximum(scale[keep], np.finfo(float).tiny)
+        out[k] = float(error.max())
+    return out
+
+
+def validate_presets(max_l_use=2000, presets=None, repeats=2, user_config=None, base_config=None):
+    """
+    computes the noiseless power spectra of the base cosmology with each preset and with REFERENCE, and reports
+    the fractional error and the runtime of each preset
+
+    Parameters
+    ----------
+    max_l_use : int, default 2000
+        largest multipole of the comparison
+    presets : list of str, optional
+        presets to validate, where None stands for the settings of base_config.yaml and extra_l; by default, None
+        and every preset in PRESETS
+    repeats : int, default 2
+        number of calculations of which the fastest is reported (the first also fills CAMB's cached tables)
+    user_config, base_config : str, optional
+        yaml files of the config_obj, by default those of the package
+
+    Returns
+    -------
+    dict
+        {preset: {'runtime_s': fastest wall time of get_cls, 'max_fractional_error': {spectrum: error}}}, with
+        None under 'base_config' and the runtime of the reference under 'reference'
+    """
+    from deepcmbsim.params_io import config_obj
+    from deepcmbsim.camb_power_spectrum import CAMBPowerSpectrum
+
+    def run(preset):
+        kwargs = {k: v for k, v in [('user_config', user_config), ('base_config', base_config)] if v is not None}
+        co = config_obj(**kwargs)
+        for k, v in [("verbose", False), ("max_l_use", max_l_use), ("noise_type", None), ("reuse_transfers", False),
+                     ("accuracy_preset", preset), ("L_SAMPLING", None), ("BINNING", None)]:
+            co.update_val(k, v, verbose=False)
+        ps = CAMBPowerSpectrum(co)
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            cls = ps.get_cls()
+            times.append(time.perf_counter() - start)
+        return cls, min(times)
+
+    reference, reference_s = run(REFERENCE)
+    out = {'reference': {'runtime_s': reference_s}}
+    for preset in (presets if presets is not None else [None] + list(PRESETS)):
+        cls, runtime_s = run(preset)
+        out[preset if preset is not None else 'base_config'] = {
+            'runtime_s': runtime_s, 'max_fractional_error': fractional_errors(cls, reference)}
+    return out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max_l_use', type=int, default=2000, help='largest multipole of the comparison')
+    parser.add_argument('--presets', nargs='*', default=None, help='presets to validate; by default all')
+    args = parser.parse_args()
+    for name, result in validate_presets(max_l_use=args.max_l_use, presets=args.presets).items():
+        errors = ', '.join(f"{k} {v:.2e}" for k, v in result.get('max_fractional_error', {}).items())
+        print(f"{name:15s} {result['runtime_s']:8.2f} s  {errors}")
@@ -0,0 +1,57 @@
+"""
+space-filling designs for parameter sweeps, as an alternative to the full Cartesian product of the ITERABLES,
+whose size grows exponentially with the number of swept parameters
+"""
+
+import numpy as np
+
+DESIGNS = ['grid', 'latin_hypercube', 'sobol', 'random']
+
+
+def _unit_samples(design, n_points, n_dims, seed):
+    """
+    Returns
+    -------
+    np.ndarray
+        (n_points, n_dims) array of samples in the unit hypercube
+    """
+    rng = np.random.default_rng(seed)
+    if design == 'random':
+        return rng.random((n_points, n_dims))
+    if design == 'latin_hypercube':
+        # one sample in each of n_points equal strata of every dimension, with the strata paired at random
+        strata = np.stack([rng.permutation(n_points) for _ in range(n_dims)], axis=-1)
+        return (strata + rng.random((n_points, n_dims))) / n_points
+    if design == 'sobol':
+        try:
+            from scipy.stats import qmc
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError("the sobol design requires scipy; install it or use 'latin_hypercube'")
+        return qmc.Sobol(n_dims, scramble=True, seed=rng).random(n_points)
+    raise ValueError(f"unknown design {design}; choose one of {DESIGNS}")
+
+
+def sample_points(iterables, design, n_points, seed=None):
+    """
+    draws points from the box spanned by the ranges of a dictionary of iterables
+
+    Parameters
+    ----------
+    iterables : dict
+        dictionary of arrays of values, as in UserParams['ITERABLES']; each parameter is sampled between
+        the minimum and the maximum of its values
+    design : str
+        one of 'latin_hypercube', 'sobol' (scrambled, best balanced when n_points is a power of 2), or 'random'
+    n_points : int
+        number of points to draw
+    seed : int, optional
+        seed of the random number generator, so that the same design is drawn by every shard and every resume
+
+    Returns
+    -------
+    np.ndarray
+        (n_points, len(iterables)) array of parameter values in the order of iterables
+    """
+    low = np.array([np.min(v) for v in iterables.values()], dtype=float)
+    high = np.array([np.max(v) for v in iterables.values()], dtype=float)
+    return low + (high - low) * _unit_samples(design, int(n_points), len(iterables), seed)
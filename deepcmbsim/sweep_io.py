@@ -0,0 +1,582 @@
+"""
+module for reading and combining the outputs of parameter sweeps made with CAMBPowerSpectrum.loop_sims
+"""
+
+import functools
+import glob
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import h5py
+import numpy as np
+from deepcmbsim.binning import Binning
+
+SPECTRA = ['clTT', 'clEE', 'clBB', 'clTE', 'clPP', 'clPT', 'clPE']
+
+MULTIPOLES_FILE = "multipoles.h5"
+
+
+def dataset_options(storage=None):
+    """
+    keyword arguments of h5py create_dataset for power spectra stored with the given settings
+
+    Parameters
+    ----------
+    storage : dict, optional
+        as in UserParams['STORAGE'], with `dtype` (e.g. 'f8', 'f4' or 'f2'), `compression` (None, 'gzip' or
+        'lzf'), `compression_opts` (the gzip level) and `shuffle`; by default, uncompressed float64
+
+    Returns
+    -------
+    dict
+        dtype, compression, compression_opts and shuffle
+    """
+    storage = storage or {}
+    compression = storage.get('compression')
+    if compression not in [None, 'gzip', 'lzf']:
+        raise ValueError(f"STORAGE compression must be None, 'gzip' or 'lzf', not {compression}")
+    return {'dtype': np.dtype(storage.get('dtype') or 'f8'), 'compression': compression,
+            'compression_opts': storage.get('compression_opts') if compression == 'gzip' else None,
+            'shuffle': bool(storage.get('shuffle', False))}
+
+
+def _to_dtype(cls, dtype):
+    """
+    power spectra cast to the storage dtype, which raises rather than silently storing values that do not fit
+    (e.g. clPP, of order 1e-7, underflows to zero in float16)
+    """
+    cls = np.asarray(cls)
+    out = cls.astype(dtype)
+    if (out.dtype != cls.dtype) and (np.any((out == 0) != (cls == 0)) or np.any(np.isinf(out) & np.isfinite(cls))):
+        raise ValueError(f"power spectra between {np.abs(cls).min():.3g} and {np.abs(cls).max():.3g} cannot be "
+                         f"stored as {dtype}; use a wider dtype, or spectra normalized closer to unity")
+    return out
+
+
+def shared_multipoles_link(savedir, l):
+    """
+    writes the multipoles l, if they are not there already, to the file MULTIPOLES_FILE in savedir, which holds
+    each distinct set of multipoles of the runs saved there once
+
+    Returns
+    -------
+    h5py.ExternalLink
+        link to the multipoles, relative to savedir, which is stored as `l` in the results file of each run and
+        read through transparently by h5py
+    """
+    l = np.asarray(l)
+    name = 'l_' + hashlib.sha1(l.tobytes() + str(l.dtype).encode()).hexdigest()[:16]
+    with h5py.File(os.path.join(savedir, MULTIPOLES_FILE), 'a') as f:
+        if name not in f:
+            f.create_dataset(name, data=l)
+    return h5py.ExternalLink(MULTIPOLES_FILE, name)
+
+
+def read_run(savedir, run_id):
+    """
+    reads a single run saved by CAMBPowerSpectrum.savecls
+
+    Parameters
+    ----------
+    savedir : str
+        directory into which the run was saved
+    run_id : str
+        ID of the run
+
+    Returns
+    -------
+    tuple
+        the results dict, the params dict, the position of the run in the loop_sims grid, and the dict of
+        values of the ITERABLES of the run (the last two are None if the run was not made by loop_sims)
+    """
+    with h5py.File(os.path.join(savedir, f"{run_id}_results.h5"), 'r') as f:
+        results = {k: f[k][()] for k in f.keys()}
+        grid_index = f.attrs.get('grid_index')
+        swept_params = json.loads(f.attrs['swept_params']) if 'swept_params' in f.attrs else None
+    with open(os.path.join(savedir, f"{run_id}_params.yaml"), 'r') as f:
+        params = json.load(f)
+    return results, params, grid_index, swept_params
+
+
+def _read_savecls_dir(savedir):
+    """
+    reads every run saved to a directory by CAMBPowerSpectrum.savecls
+
+    Parameters
+    ----------
+    savedir : str
+        directory containing `{run_id}_results.h5` and `{run_id}_params.yaml` files
+
+    Returns
+    -------
+    list
+        one (grid_index, run_id, results dict, params dict, swept_params dict) tuple per run; grid_index
+        and swept_params are None for runs that were not made by loop_sims
+    """
+    runs = []
+    for results_file in sorted(glob.glob(os.path.join(savedir, "*_results.h5"))):
+        run_id = os.path.basename(results_file)[:-len("_results.h5")]
+        results, params, grid_index, swept_params = read_run(savedir, run_id)
+        runs.append((grid_index, run_id, results, params, swept_params))
+    return runs
+
+
+def read_binning(f):
+    """
+    Parameters
+    ----------
+    f : h5py.File
+        file written by SweepWriter
+
+    Returns
+    -------
+    binning.Binning or None
+        binning of the band powers stored in f, or None if f holds power spectra at every stored multipole
+    """
+    if 'binning_edges' not in f:
+        return None
+    return Binning(f['binning_edges'][()], f['binning_l'][()], ell_factor=bool(f['binning_ell_factor'][()]))
+
+
+def _read_sweep_file(path):
+    """
+    reads every run of a file written by SweepWriter, in the same format as _read_savecls_dir
+    """
+    runs = []
+    with h5py.File(path, 'r') as f:
+        spectra = [k for k in SPECTRA if k in f]
+        parameters = f['parameters'][()]
+        for i in range(len(f['run_id'])):
+            results = {'l': f['l'][()], **{k: f[k][i] for k in spectra}}
+            swept_params = {name: parameters[name][i].item() for name in parameters.dtype.names}
+            runs.append((int(f['grid_index'][i]), f['run_id'].asstr()[i], results,
+                         json.loads(f['run_params'].asstr()[i]), swept_params))
+    return runs
+
+
+class SweepWriter:
+    """
+    writer for a single hdf5 file that holds every run of a sweep. Each power spectrum is stored as a chunked
+    (n_runs, n_l) dataset, and the swept parameters as a structured (n_runs,) dataset `parameters` whose fields
+    are the names of the ITERABLES; `run_id`, `grid_index` and `run_params` (the json-encoded parameters of each
+    run) are aligned with them on the run axis, and `l` is stored once. Band powers are stored with the
+    `binning_edges`, `binning_l` and `binning_ell_factor` of their binning.Binning (see read_binning). Runs can be
+    appended one at a time, including to an existing file, so the writer can be used while
+    CAMBPowerSpectrum.loop_sims is running
+
+    Attributes
+    ----------
+    path : str
+        path to the hdf5 file
+    param_names : list of str
+        names of the swept parameters, e.g. the keys of UserParams['ITERABLES']
+    """
+    def __init__(self, path, param_names, mode='a', chunk_bytes=2**20, storage=None, binning=None):
+        """
+        Parameters
+        ----------
+        path : str
+            path to the hdf5 file
+        param_names : list of str
+            names of the swept parameters, which are stored as float64
+        mode : {'a', 'w', 'w-'}, default 'a'
+            permission settings for the file. With 'a', runs are appended to those already in the file
+        chunk_bytes : int, default 1 MiB
+            approximate size of the chunks in which the power spectra are stored
+        storage : dict, optional
+            dtype and compression of the power spectra, as in UserParams['STORAGE'] (see dataset_options); ignored
+            when appending to a file whose datasets already exist
+        binning : binning.Binning, optional
+            binning with which the appended runs were turned into band powers, which is stored so that noise can
+            be added to them at load time (see augment.NoiseAugmentation)
+        """
+        self.path, self.param_names = path, list(param_names)
+        self._binning = binning
+        self._chunk_bytes = chunk_bytes
+        self._options = dataset_options(storage)
+        self._param_dtype = np.dtype([(name, 'f8') for name in self.param_names])
+        self._pending, self._last_flush = [], time.perf_counter()
+        self._file = h5py.File(path, mode)
+        # when appending to an existing file, buffer as many runs as fit in one of its chunks
+        existing = [k for k in SPECTRA if k in self._file]
+        self._chunk_runs = self._file[existing[0]].chunks[0] if existing else 1
+        if 'parameters' in self._file and self._file['parameters'].dtype.names != self._param_dtype.names:
+            names = self._file['parameters'].dtype.names
+            self._file.close()
+            raise ValueError(f"{path} holds a sweep over {names}, not {tuple(self.param_names)}")
+
+    def __len__(self):
+        return (len(self._file['run_id']) if 'run_id' in self._file else 0) + len(self._pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _create_datasets(self, cls_dict):
+        f, n_l = self._file, len(cls_dict['l'])
+        self._chunk_runs = max(1, self._chunk_bytes // (self._options['dtype'].itemsize * n_l))
+        f.create_dataset('l', data=np.asarray(cls_dict['l']))
+        if self._binning is not None:
+            f.create_dataset('binning_edges', data=self._binning.edges)
+            f.create_dataset('binning_l', data=self._binning.l)
+            f.create_dataset('binning_ell_factor', data=bool(self._binning.ell_factor))
+        for k in SPECTRA:
+            if k in cls_dict:
+                f.create_dataset(k, shape=(0, n_l), maxshape=(None, n_l), chunks=(self._chunk_runs, n_l),
+                                 **self._options)
+        f.create_dataset('parameters', shape=(0,), maxshape=(None,), chunks=True, dtype=self._param_dtype)
+        f.create_dataset('run_id', shape=(0,), maxshape=(None,), chunks=True, dtype=h5py.string_dtype())
+        f.create_dataset('grid_index', shape=(0,), maxshape=(None,), chunks=True, dtype='i8')
+        f.create_dataset('run_params', shape=(0,), maxshape=(None,), chunks=True, dtype=h5py.string_dtype())
+
+    def append(self, run_id, cls_dict, param_values, grid_index=-1, run_params=None):
+        """
+        appends a single run to the file. Runs are buffered and written a chunk of runs at a time (or on flush or
+        close), so that each compressed chunk is only compressed once
+
+        Parameters
+        ----------
+        run_id : str
+            ID of the run
+        cls_dict : dict
+            output of CAMBPowerSpectrum.get_cls
+        param_values : dict
+            values of the swept parameters, keyed by param_names; missing values are stored as NaN
+        grid_index : int, default -1
+            position of the run in the loop_sims grid, or -1 if it is not part of a grid
+        run_params : dict, optional
+            full parameters of the run, e.g. from CAMBPowerSpectrum.result_parameters
+        """
+        f = self._file
+        if 'l' not in f:
+            self._create_datasets(cls_dict)
+        elif len(f['l']) != len(cls_dict['l']):
+            raise ValueError(f"{self.path} holds power spectra of length {len(f['l'])}, not {len(cls_dict['l'])}")
+        row = {k: _to_dtype(cls_dict[k], f[k].dtype) for k in SPECTRA if k in f}
+        row['parameters'] = tuple(param_values.get(name, np.nan) for name in self.param_names)
+        row['run_id'], row['grid_index'] = run_id, grid_index
+        row['run_params'] = json.dumps(run_params if run_params is not None else {},
+                                       default=lambda x: np.asarray(x).tolist())
+        self._pending.append(row)
+        if len(self._pending) >= self._chunk_runs:
+            self._write_pending()
+
+    def _write_pending(self):
+        """
+        writes the buffered runs to the file
+        """
+        if len(self._pending) == 0:
+            return
+        f, n, rows = self._file, len(self._file['run_id']), self._pending
+        for k in rows[0]:
+            if k in SPECTRA:
+                values = np.stack([row[k] for row in rows])
+            elif k == 'parameters':
+                values = np.array([row[k] for row in rows], dtype=self._param_dtype)
+            else:
+                values = [row[k] for row in rows]
+            f[k].resize(n + len(rows), axis=0)
+            f[k][n:] = values
+        self._pending = []
+
+    def flush(self, min_interval_s=0.):
+        """
+        writes the buffered runs and flushes the file to disk, so that the runs appended so far survive an
+        interruption
+
+        Parameters
+        ----------
+        min_interval_s : float, default 0
+            do nothing if the last flush was less than this many seconds ago; each flush rewrites (and
+            recompresses) the last, partly filled chunk, so flushing after every run can cost more than the run
+        """
+        if time.perf_counter() - self._last_flush < min_interval_s:
+            return
+        self._write_pending()
+        self._file.flush()
+        self._last_flush = time.perf_counter()
+
+    def close(self):
+        if self._file:
+            self._write_pending()
+            self._file.close()
+
+
+class BackgroundWriter:
+    """
+    thread that passes each item put into a bounded queue, in order, to a write function, so that writing overlaps
+    with whatever the caller does next (e.g. the next CAMB calculation, which releases the GIL). put blocks while
+    the queue is full, so at most queue_size items wait in memory. An exception raised by write is raised again by
+    the next put or by close, and the remaining items are discarded
+    """
+    def __init__(self, write, queue_size=4):
+        """
+        Parameters
+        ----------
+        write : callable
+            function called as write(item) for each item, in the writer thread
+        queue_size : int, default 4
+            maximum number of items waiting to be written
+        """
+        self._write, self._errors = write, []
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._errors:  # keep emptying the queue, so that put never blocks forever
+                continue
+            try:
+                self._write(item)
+            except Exception as e:
+                self._errors.append(e)
+
+    def put(self, item):
+        """
+        queues item to be written, waiting while the queue is full
+        """
+        if self._errors:
+            raise self._errors[0]
+        self._queue.put(item)
+
+    def close(self):
+        """
+        waits until every queued item has been written
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+
+class SweepDataset:
+    """
+    read-only, lazily indexed view of a sweep file written by SweepWriter, for feeding training loops. The file
+    is opened once; power spectra that are stored contiguously and uncompressed (see to_contiguous) are memory
+    mapped, and otherwise they are read through a large hdf5 chunk cache. Indexing returns
+    (params, cls), where params is a (n, n_params) float array in the order of param_names and cls is a
+    (n, n_spectra, n_l) array in the order of spectra, in the dtype in which they are stored
+
+    Attributes
+    ----------
+    path : str
+        path to the hdf5 file
+    spectra : list of str
+        names of the power spectra returned by indexing
+    param_names : list of str
+        names of the swept parameters
+    params : np.ndarray
+        (n_runs, n_params) array of the values of the swept parameters, read into memory when first used;
+        until then, indexing with an int or a slice reads only the requested rows from the file, so that
+        reading a sweep in order (e.g. in map_pipeline) uses the same memory whatever its size
+    l : np.ndarray
+        multipoles of the power spectra
+    run_id : np.ndarray
+        IDs of the runs, read into memory when first used (see also run_ids)
+    memory_mapped : bool
+        whether every power spectrum is memory mapped rather than read through the chunk cache
+    binning : binning.Binning or None
+        binning with which the power spectra were turned into band powers (whose mean multipoles are l), or None
+        if they are stored at the multipoles l
+    """
+    def __init__(self, path, spectra=None, cache_mb=256):
+        """
+        Parameters
+        ----------
+        path : str
+            path to a file written by SweepWriter
+        spectra : list of str, optional
+            subset of the power spectra to return; by default, every spectrum in the file
+        cache_mb : float, default 256
+            size of the hdf5 chunk cache of each dataset that is not memory mapped
+        """
+        self.path = path
+        self._file = h5py.File(path, 'r', rdcc_nbytes=int(cache_mb * 1024**2), rdcc_nslots=10007)
+        self.spectra = spectra if spectra is not None else [k for k in SPECTRA if k in self._file]
+        self.param_names = list(self._file['parameters'].dtype.names)
+        self.l = self._file['l'][()]
+        self.binning = read_binning(self._file)
+        self._arrays = [self._memmap(self._file[k]) for k in self.spectra]
+        self.memory_mapped = all(isinstance(a, np.memmap) for a in self._arrays)
+
+    def _memmap(self, dataset):
+        """
+        returns a memory map of dataset if it is stored contiguously and uncompressed, and dataset itself otherwise
+        """
+        offset = dataset.id.get_offset()
+        if (dataset.chunks is None) and (dataset.compression is None) and (offset is not None):
+            return np.memmap(self.path, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+        return dataset
+
+    @functools.cached_property
+    def params(self):
+        return self._param_rows(slice(None))
+
+    @functools.cached_property
+    def run_id(self):
+        return self._file['run_id'].asstr()[()]
+
+    def _param_rows(self, idx):
+        """
+        values of the swept parameters of the runs idx (an int or a slice), from params if it has been read and
+        otherwise from the file
+        """
+        if 'params' in self.__dict__:
+            return self.params[idx]
+        rows = self._file['parameters'][idx]
+        return np.stack([rows[name] for name in self.param_names], axis=-1)
+
+    def run_ids(self, idx):
+        """
+        Parameters
+        ----------
+        idx : int or slice
+            runs whose IDs to read
+
+        Returns
+        -------
+        str or np.ndarray
+            IDs of the runs idx, from run_id if it has been read and otherwise from the file
+        """
+        if 'run_id' in self.__dict__:
+            return self.run_id[idx]
+        return self._file['run_id'].asstr()[idx]
+
+    def __len__(self):
+        return len(self._file['run_id'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getitem__(self, idx):
+        """
+        Parameters
+        ----------
+        idx : int, slice, or array_like of int
+            runs to read
+
+        Returns
+        -------
+        tuple
+            (params, cls) for the requested runs
+        """
+        if isinstance(idx, (int, np.integer)):
+            return self._param_rows(idx), np.stack([a[idx] for a in self._arrays])
+        if isinstance(idx, slice):
+            return self._param_rows(idx), np.stack([a[idx] for a in self._arrays], axis=1)
+        idx = np.asarray(idx)
+        # hdf5 requires increasing, unique indices, so read those and then restore the requested order
+        unique_idx, inverse = np.unique(idx, return_inverse=True)
+        cls = np.empty((len(unique_idx), len(self._arrays), len(self.l)),
+                       dtype=np.result_type(*[a.dtype for a in self._arrays]))
+        for i, a in enumerate(self._arrays):
+            cls[:, i] = a[unique_idx]
+        return self.params[idx], cls[inverse]
+
+    def iter_batches(self, batch_size, shuffle=True, seed=None, drop_last=False):
+        """
+        iterates once over the dataset in minibatches
+
+        Parameters
+        ----------
+        batch_size : int
+            number of runs in each batch
+        shuffle : bool, default True
+            whether to visit the runs in a random order
+        seed : int, optional
+            seed for the random order
+        drop_last : bool, default False
+            whether to drop the last batch if it has fewer than batch_size runs
+
+        Returns
+        -------
+        iterator
+            yields (params, cls) for each batch
+        """
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else np.arange(len(self))
+        stop = len(self) - (len(self) % batch_size) if drop_last else len(self)
+        for start in range(0, stop, batch_size):
+            yield self[order[start:start + batch_size]]
+
+    def close(self):
+        self._arrays = []
+        self._file.close()
+
+
+def to_contiguous(path, outfile):
+    """
+    rewrites a sweep file with its power spectra stored contiguously and uncompressed, so that SweepDataset can
+    memory map them. The new file cannot be appended to
+
+    Parameters
+    ----------
+    path : str
+        path to a file written by SweepWriter
+    outfile : str
+        path of the new file
+
+    Returns
+    -------
+    None
+    """
+    with h5py.File(path, 'r') as f_in, h5py.File(outfile, 'w') as f_out:
+        for k in f_in.keys():
+            f_out.create_dataset(k, data=f_in[k][()], dtype=f_in[k].dtype)
+
+
+def merge_shards(shard_outputs, outfile, storage=None):
+    """
+    combines the runs saved by several shards of a loop_sims grid (see the shard_index and shard_count
+    settings in user_config.yaml) into a single hdf5 file, ordered by their position in the full grid
+
+    Parameters
+    ----------
+    shard_outputs : list of str
+        directories into which each shard saved its runs with CAMBPowerSpectrum.savecls, and/or files
+        into which each shard saved its runs with SweepWriter (e.g. via the outfile argument of loop_sims)
+    outfile : str
+        path of the merged hdf5 file, in the format of SweepWriter
+    storage : dict, optional
+        dtype and compression of the power spectra of the merged file (see dataset_options)
+
+    Returns
+    -------
+    None
+    """
+    runs = [run for path in shard_outputs
+            for run in (_read_savecls_dir(path) if os.path.isdir(path) else _read_sweep_file(path))]
+    if any(run[0] is None for run in runs):
+        raise ValueError("can only merge runs that were made by loop_sims")
+    runs.sort(key=lambda run: run[0])
+    grid_indices = np.array([run[0] for run in runs], dtype=int)
+    if len(np.unique(grid_indices)) != len(grid_indices):
+        raise ValueError("the same grid point appears in more than one shard; are the shards disjoint?")
+
+    binnings = []
+    for path in shard_outputs:
+        if not os.path.isdir(path):
+            with h5py.File(path, 'r') as f:
+                binnings.append(read_binning(f))
+    binning = next((b for b in binnings if b is not None), None)
+    with SweepWriter(outfile, list(runs[0][4].keys()), mode='w', storage=storage, binning=binning) as writer:
+        for grid_index, run_id, results, params, swept_params in runs:
+            writer.append(run_id, results, swept_params, grid_index=grid_index, run_params=params)
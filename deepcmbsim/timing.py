@@ -0,0 +1,108 @@
+"""
+instrumentation for the stages of a power spectrum calculation (CAMB, noise, parameter serialization, ...),
+which records the wall time and the memory use of each stage of each run and passes every measurement on to
+any number of user-supplied collectors
+"""
+
+import contextlib
+import resource
+import sys
+import time
+import tracemalloc
+
+# ru_maxrss is in kilobytes on linux and in bytes on macOS
+_MAXRSS_UNITS = 1 if sys.platform == 'darwin' else 1024
+
+
+def _maxrss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNITS
+
+
+class StageTimer:
+    """
+    records the wall time and memory use of named stages of each run
+
+    Attributes
+    ----------
+    records : dict
+        {run_id: {stage: measurement}} for every run, where each measurement is a dict with `wall_s` (wall
+        time in seconds), `maxrss_increase_bytes` (how much the stage raised the peak resident memory of the
+        process, which includes memory allocated by CAMB), and, if trace_memory is True, `peak_python_bytes`
+        (the peak memory allocated through python during the stage, which includes numpy arrays)
+    collectors : list of callable
+        functions called as collector(run_id, stage, measurement) after every stage, e.g. to export the
+        measurements to a metrics system
+    trace_memory : bool
+        whether to trace python memory allocations with tracemalloc, which slows down python code
+    """
+    def __init__(self, collectors=None, trace_memory=False):
+        """
+        Parameters
+        ----------
+        collectors : list of callable, optional
+            functions called as collector(run_id, stage, measurement) after every stage
+        trace_memory : bool, default False
+            whether to record the peak python memory of each stage with tracemalloc
+        """
+        self.records = {}
+        self.collectors = list(collectors) if collectors is not None else []
+        self.trace_memory = trace_memory
+        self._totals = {}
+
+    def add_collector(self, collector):
+        """
+        Parameters
+        ----------
+        collector : callable
+            function called as collector(run_id, stage, measurement) after every stage
+        """
+        self.collectors.append(collector)
+
+    @contextlib.contextmanager
+    def stage(self, run_id, name):
+        """
+        context manager that measures the code it wraps as the stage `name` of run `run_id`
+        """
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            python_start = tracemalloc.get_traced_memory()[0]
+        maxrss_start = _maxrss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            measurement = {'wall_s': time.perf_counter() - start,
+                           'maxrss_increase_bytes': _maxrss_bytes() - maxrss_start}
+            if self.trace_memory:
+                measurement['peak_python_bytes'] = tracemalloc.get_traced_memory()[1] - python_start
+            self.add(run_id, name, measurement)
+
+    def add(self, run_id, name, measurement):
+        """
+        records a measurement of the stage `name` of run `run_id` and passes it to the collectors; this is called
+        by stage, and can also be used for measurements made elsewhere, e.g. in a worker process of
+        CAMBPowerSpectrum.loop_sims
+        """
+        self.records.setdefault(run_id, {})[name] = measurement
+        total = self._totals.setdefault(name, {'count': 0, 'total_s': 0., 'max_s': 0., 'max_maxrss_increase_bytes': 0})
+        total['count'] += 1
+        total['total_s'] += measurement['wall_s']
+        total['max_s'] = max(total['max_s'], measurement['wall_s'])
+        total['max_maxrss_increase_bytes'] = max(total['max_maxrss_increase_bytes'], measurement['maxrss_increase_bytes'])
+        if 'peak_python_bytes' in measurement:
+            total['max_peak_python_bytes'] = max(total.get('max_peak_python_bytes', 0), measurement['peak_python_bytes'])
+        for collector in self.collectors:
+            collector(run_id, name, measurement)
+
+    def summary(self):
+        """
+        Returns
+        -------
+        dict
+            {stage: aggregate} over every run measured so far (including runs whose records were overwritten),
+            where each aggregate has the number of times the stage ran, its total, mean and maximum wall time,
+            and its largest memory increase
+        """
+        return {name: {**total, 'mean_s': total['total_s'] / total['count']} for name, total in self._totals.items()}
@@ -0,0 +1,30 @@
+"""
+fixtures shared by the tests
+"""
+
+import pytest
+from deepcmbsim.params_io import config_obj
+
+
+def small_config_obj(**kwargs):
+    """
+    config_obj (with kwargs passed to config_obj) for power spectra up to l=200 with a small max_eta_k, whose CAMB
+    calculations take a fraction of a second
+    """
+    co = config_obj(**kwargs)
+    for k, v in [("verbose", False), ("max_l_use", 200), ("max_eta_k", 2000.), ("max_eta_k_tensor", 2000.)]:
+        co.update_val(k, v, verbose=False)
+    return co
+
+
+@pytest.fixture
+def small_config():
+    return small_config_obj()
+
+
+@pytest.fixture
+def make_small_config():
+    """
+    small_config_obj itself, for tests that need more than one config_obj
+    """
+    return small_config_obj
@@ -0,0 +1,51 @@
+"""
+tests augment.py
+"""
+
+import numpy as np
+import pytest
+from deepcmbsim.camb_power_spectrum import CAMBPowerSpectrum
+from deepcmbsim.augment import NoiseAugmentation
+from deepcmbsim.sweep_io import SweepDataset
+
+
+def test_noise_augmentation(small_config):
+    co = small_config
+    ps = CAMBPowerSpectrum(co)
+    noisy = ps.get_cls()
+    ps.update_val("add_noise", False)
+    noiseless = ps.get_cls()
+    spectra = ['clTT', 'clEE', 'clPP']
+    augmentation = NoiseAugmentation(spectra, noiseless['l'], co.UserParams['noise_uKarcmin'],
+                                     co.UserParams['beamfwhm_arcmin'])
+    cls = np.stack([noiseless[k] for k in spectra])[None]
+    params, augmented = augmentation(np.zeros((1, 1)), cls)
+    assert params.shape == (1, 3) and len(augmentation.param_names(['InitPower.r'])) == 3
+    for i, k in enumerate(spectra):
+        assert np.allclose(augmented[0, i], noisy[k])
+
+    varied = NoiseAugmentation(spectra, noiseless['l'], (1., 10.), (1., 5.), seed=0)
+    batches = list(varied.transform([(np.zeros((4, 1)), np.repeat(cls, 4, axis=0))] * 2))
+    assert len(batches) == 2 and not np.array_equal(batches[0][1], batches[1][1])
+    assert np.all((batches[0][0][:, 1] >= 1.) & (batches[0][0][:, 1] <= 10.))
+
+
+def test_noise_augmentation_binned(tmp_path, small_config):
+    co = small_config
+    for k, v in [("add_noise", False), ("ITERABLES", {"InitPower.r": np.array([0.01])}),
+                 ("BINNING", {"scheme": "linear", "n_bins": 10, "l_min": 2, "ell_factor": False})]:
+        co.update_val(k, v)
+    ps = CAMBPowerSpectrum(co)
+    ps.loop_sims(outfile=str(tmp_path / "sweep.h5"), keep_results=False)
+    with SweepDataset(str(tmp_path / "sweep.h5")) as ds:
+        with pytest.raises(ValueError):
+            NoiseAugmentation(ds.spectra, ds.l, 5., 3.)
+        augmentation = NoiseAugmentation(ds.spectra, ds.l, co.UserParams['noise_uKarcmin'],
+                                         co.UserParams['beamfwhm_arcmin'], binning=ds.binning)
+        _, augmented = augmentation(*ds[:])
+        spectra = ds.spectra
+    co.update_val("InitPower.r", 0.01)
+    co.update_val("add_noise", True)
+    noisy = ps.binning.bin_dict(ps.get_cls())
+    for i, k in enumerate(spectra):
+        assert np.allclose(augmented[0, i], noisy[k])
@@ -0,0 +1,29 @@
+"""
+tests binning.py
+"""
+
+import numpy as np
+import pytest
+from deepcmbsim.binning import Binning
+
+
+def test_binning():
+    l = np.arange(101)
+    cls = np.random.default_rng(0).random((5, 101))
+    binning = Binning.from_config({'scheme': 'linear', 'n_bins': 10, 'l_min': 2}, l)
+    band_powers = binning(cls)
+    assert band_powers.shape == (5, 10) and binning.edges[0] == 2 and binning.edges[-1] == 101
+    lo, hi = binning.edges[3], binning.edges[4]
+    assert np.allclose(band_powers[:, 3], cls[:, lo:hi].mean(axis=1))
+    assert np.isclose(binning.l_eff[3], l[lo:hi].mean())
+
+    weighted = Binning([2, 10, 50], l, ell_factor=True)
+    assert np.allclose(weighted(cls)[:, 1], (cls * l * (l + 1) / (2 * np.pi))[:, 10:50].mean(axis=1))
+    binned = weighted.bin_dict({'l': l, 'clTT': cls[0]})
+    assert np.array_equal(binned['l'], weighted.l_eff) and binned['clTT'].shape == (2,)
+
+    log_binning = Binning.from_config({'scheme': 'log', 'n_bins': 8, 'l_min': 2}, l)
+    assert np.all(np.diff(log_binning.edges) > 0) and log_binning.edges[-1] == 101
+    assert Binning.from_config({'scheme': None}, l) is None
+    with pytest.raises(ValueError):
+        Binning([2, 3, 4], np.array([2, 10]))
@@ -0,0 +1,32 @@
+"""
+tests cache.py
+"""
+
+import numpy as np
+from deepcmbsim.cache import SpectraCache
+from deepcmbsim.camb_power_spectrum import CAMBPowerSpectrum
+
+
+def test_cache_lru_eviction(tmp_path):
+    cls = {'clTT': np.random.rand(1000)}  # 8 kB per entry
+    cache = SpectraCache(str(tmp_path), max_mb=20/1024)
+    keys = [SpectraCache.key({'r': r}, 1000, ['clTT']) for r in range(3)]
+    assert keys[0] == SpectraCache.key({'r': 0}, 1000, ['clTT']) and len(set(keys)) == 3
+    cache.put(keys[0], cls)
+    cache.put(keys[1], cls)
+    assert np.array_equal(cache.get(keys[0])['clTT'], cls['clTT'])
+    cache.put(keys[2], cls)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+
+
+def test_get_cls_cache_hit(tmp_path, monkeypatch, small_config):
+    co = small_config
+    co.update_val("cache_dir", str(tmp_path))
+    ps = CAMBPowerSpectrum(co)
+    first, first_noise = ps.get_cls(), ps.get_noise()[0]
+    monkeypatch.setattr(ps, "_camb_cls", None)  # any call to CAMB would now fail
+    ps.update_val("noise_uKarcmin", 0)
+    second = ps.get_cls()
+    assert ps.cache.hits == 1
+    assert np.allclose(first['clTT'] - first_noise, second['clTT'])
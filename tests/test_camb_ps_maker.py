@@ -4,7 +4,7 @@ tests camb_ps_maker.py
 
 import numpy as np
 from deepcmbsim.params_io import config_obj
-from deepcmbsim.camb_power_spectrum import CAMBPowerSpectrum
+from deepcmbsim.camb_power_spectrum import CAMBPowerSpectrum, _grid_points
 
 
 def test_get_noise():
@@ -22,3 +22,144 @@ def test_get_cls():
     baseline_config_obj.update_val("noise_type", None)
     clTT = CAMBPowerSpectrum(baseline_config_obj).get_cls()['clTT']
     assert len(clTT) == baseline_config_obj.UserParams['max_l_use']+1
+
+
+def test_loop_sims_parallel(make_small_config):
+    configs = [make_small_config(), make_small_config()]
+    for co in configs:
+        co.update_val("ITERABLES", {"InitPower.r": np.array([0.01, 0.1])})
+        co.CAMBparams.InitPower.ns = 0.9  # set without update_val, which the workers must also pick up
+        co.UserParams['noise_uKarcmin'] = 50
+    serial, parallel = CAMBPowerSpectrum(configs[0]), CAMBPowerSpectrum(configs[1])
+    serial.loop_sims(processes=1)
+    parallel.loop_sims(processes=2)
+    assert len(parallel.loop_runids) == 2
+    for serial_id, parallel_id in zip(serial.loop_runids, parallel.loop_runids):
+        for k, v in serial.results[serial_id].items():
+            assert np.array_equal(np.asarray(v), np.asarray(parallel.results[parallel_id][k]))
+        assert serial.result_parameters[serial_id]['FORCAMB'] == parallel.result_parameters[parallel_id]['FORCAMB']
+        assert 'get_total_cls' in parallel.timer.records[parallel_id]
+    assert parallel.timer.summary()['total']['count'] == 2
+
+
+def test_grid_sharding():
+    iterables = {"InitPower.r": np.linspace(0.01, 0.1, 5), "Alens": np.array([0.8, 1.0, 1.2])}
+    shards = [list(_grid_points(iterables, shard_index=i, shard_count=4)) for i in range(4)]
+    points = dict(point for shard in shards for point in shard)
+    assert sorted(points.keys()) == list(range(15)) and sum(len(shard) for shard in shards) == 15
+    assert points[7] == (iterables["InitPower.r"][2], 1.0)
+
+
+def test_loop_sims_resume(tmp_path, make_small_config):
+    computed = []
+    for r_values in [[0.01], [0.01, 0.1]]:
+        co = make_small_config()
+        co.update_val("ITERABLES", {"InitPower.r": np.array(r_values)})
+        ps = CAMBPowerSpectrum(co)
+        ps.loop_sims(checkpoint_dir=str(tmp_path), resume=True)
+        computed.append(ps)
+    assert len(list(tmp_path.glob("*_results.h5"))) == 2
+    first_id = computed[0].loop_runids[0]
+    assert computed[1].loop_runids[0] == first_id
+    assert np.array_equal(computed[0].results[first_id]['clBB'], computed[1].results[first_id]['clBB'])
+    co.update_val("max_l_use", 150)  # another configuration must not reload the runs of the first
+    ps = CAMBPowerSpectrum(co)
+    ps.loop_sims(checkpoint_dir=str(tmp_path), resume=True)
+    assert first_id not in ps.loop_runids and len(ps.results[ps.loop_runids[0]]['clBB']) == 151
+
+
+def test_reuse_transfers(make_small_config):
+    power_spectra = []
+    for reuse_transfers in [True, False]:
+        co = make_small_config()
+        co.update_val("reuse_transfers", reuse_transfers)
+        power_spectra.append(CAMBPowerSpectrum(co))
+    power_spectra[0].get_cls()
+    signature = power_spectra[0]._transfers_signature
+    for ps in power_spectra:
+        ps.update_val("InitPower.r", 0.01)
+        ps.update_val("Alens", 0.8)
+    reused, recomputed = power_spectra[0].get_cls(), power_spectra[1].get_cls()
+    assert power_spectra[0]._transfers_signature == signature
+    for k in ['clTT', 'clBB', 'clPP']:
+        assert np.allclose(reused[k], recomputed[k], rtol=1e-10)
+
+
+def test_stage_timer(small_config):
+    baseline_config_obj = small_config
+    baseline_config_obj.update_val("trace_memory", True)
+    baseline_config_obj.update_val("reuse_transfers", False)
+    ps = CAMBPowerSpectrum(baseline_config_obj)
+    collected = []
+    ps.timer.add_collector(lambda run_id, stage, measurement: collected.append((run_id, stage)))
+    ps.get_cls(save_to_dict='run')
+    stages = ps.timer.records['run']
+    for stage in ['get_results', 'get_total_cls', 'get_lens_potential_cls', 'noise', 'param_serialization', 'total']:
+        assert stages[stage]['wall_s'] >= 0
+    assert 'peak_python_bytes' in stages['noise']
+    assert ('run', 'total') in collected and len(collected) == len(stages)
+
+
+def test_sampled_multipoles():
+    baseline_config_obj = config_obj()
+    baseline_config_obj.update_val("verbose", False)
+    baseline_config_obj.update_val("max_l_use", 300)
+    baseline_config_obj.update_val("noise_type", None)
+    full = CAMBPowerSpectrum(baseline_config_obj).get_cls()
+    baseline_config_obj.update_val("L_SAMPLING", {'spacing': 'log', 'n_l': 50, 'l_min': 2})
+    ps = CAMBPowerSpectrum(baseline_config_obj)
+    sampled = ps.get_cls()
+    assert ps.CAMBparams.Log_lvalues and len(sampled['l']) <= 50
+    assert sampled['l'][0] == 2 and sampled['l'][-1] == 300 and len(np.unique(sampled['l'])) == len(sampled['l'])
+    assert np.allclose(sampled['clTT'], np.asarray(full['clTT'])[sampled['l']], rtol=1e-2)
+
+
+def test_multipole_planning():
+    co = config_obj()
+    for k, v in [("verbose", False), ("max_l_use", 3000), ("beamfwhm_arcmin", 30.), ("reuse_transfers", False)]:
+        co.update_val(k, v)
+    ps = CAMBPowerSpectrum(co)
+    assert ps.max_l_use == 1080  # limited by the beam
+    co.update_val("noise_type", None)
+    co.update_val("max_l_use", 150)
+    cls = ps.get_cls()
+    assert ps.max_l_use == 150 and ps.CAMBparams.max_l == 150 + co.UserParams['extra_l'] and len(cls['clTT']) == 151
+    co.update_val("cls_to_output", ['clPP'])
+    params, _ = ps._output_camb_params(["clPP"])
+    assert params.max_l_tensor == 100 and ps.CAMBparams.max_l_tensor == ps.max_l_calc
+    assert np.allclose(ps.get_cls()['clPP'], cls['clPP'])
+
+
+def test_get_cls_batch(small_config):
+    co = small_config
+    ps = CAMBPowerSpectrum(co)
+    table = np.array([(0.1, 1.0), (0.01, 0.5), (0.01, 1.0)], dtype=[('InitPower.r', 'f8'), ('Alens', 'f8')])
+    before = (co.CAMBparams.InitPower.r, co.CAMBparams.Alens)
+    batch = ps.get_cls_batch(table)
+    assert batch['clBB'].shape == (3, 201) and (co.CAMBparams.InitPower.r, co.CAMBparams.Alens) == before
+    for j, (r, alens) in enumerate(table.tolist()):
+        co.update_val("InitPower.r", r)
+        co.update_val("Alens", alens)
+        cls = ps.get_cls()
+        for k in ['clTT', 'clBB', 'clPP']:
+            assert np.allclose(batch[k][j], cls[k], rtol=1e-10, atol=0)
+    co.update_val("InitPower.r", before[0])
+    co.update_val("Alens", before[1])
+    parallel = ps.get_cls_batch({'InitPower.r': table['InitPower.r'], 'Alens': table['Alens']}, processes=2)
+    assert all(np.array_equal(parallel[k], batch[k]) for k in batch)
+
+
+def test_plan_restores_camb_params():
+    co = config_obj()
+    for k, v in [("verbose", False), ("max_l_use", 1000), ("accuracy_preset", "high-precision"),
+                 ("L_SAMPLING", {"spacing": "log", "n_l": 50, "l_min": 2})]:
+        co.update_val(k, v)
+    base = config_obj().CAMBparams
+    ps = CAMBPowerSpectrum(co)
+    assert ps.CAMBparams.Accuracy.AccuracyBoost == 1.5 and ps.CAMBparams.Log_lvalues
+    co.update_val("accuracy_preset", None)
+    co.update_val("L_SAMPLING", {"spacing": None})
+    ps._plan_multipoles()
+    assert ps.CAMBparams.max_eta_k == base.max_eta_k and ps.CAMBparams.max_eta_k_tensor == base.max_eta_k_tensor
+    assert ps.CAMBparams.Accuracy.AccuracyBoost == base.Accuracy.AccuracyBoost
+    assert ps.CAMBparams.Log_lvalues == base.Log_lvalues
@@ -43,3 +43,13 @@ def test_flatmap_TQU():
     degrees = 5
     out_shape = nmt.synfast_flat(pixels, pixels, degrees*np.pi/180, degrees*np.pi/180, np.random.rand(6, ells), [0, 2]).shape
     assert flatmap(pixels, degrees, cl_dict=teb_dict).flatmap('TQU').shape == out_shape
+
+
+def test_flatmaps():
+    ells = int(1e4+1)
+    cl_dicts = [{k: np.random.rand(ells) for k in ['clTT', 'clEE', 'clBB', 'clTE']} for _ in range(3)]
+    fm = flatmap(64, 5, cl_dict=cl_dicts[0])
+    maps = fm.flatmaps('TQU', n_realizations=4, seed=1)
+    assert maps.shape == (4,) + fm.flatmap('TQU').shape
+    assert np.array_equal(maps, fm.flatmaps('TQU', n_realizations=4, seed=1, processes=2))
+    assert fm.flatmaps('T', cl_dicts=cl_dicts, seed=1).shape == (3, 1, 64, 64)
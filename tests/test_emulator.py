@@ -0,0 +1,31 @@
+"""
+tests emulator.py
+"""
+
+import numpy as np
+import pytest
+from deepcmbsim.emulator import SpectrumEmulator
+from deepcmbsim.sweep_io import SweepWriter
+
+
+def test_spectrum_emulator(tmp_path):
+    path = str(tmp_path / "sweep.h5")
+    l = np.arange(101)
+    spectra = lambda r, a: {'l': l, 'clTT': a * (1 + r) * np.exp(-l / 30.), 'clTE': r * np.sin(l / 10.)}
+    with SweepWriter(path, ['InitPower.r', 'Alens'], mode='w') as writer:
+        for i, (r, a) in enumerate((r, a) for r in np.linspace(0.01, 0.1, 8) for a in np.linspace(0.8, 1.2, 8)):
+            writer.append(f'run{i}', spectra(r, a), {'InitPower.r': r, 'Alens': a})
+    emulator = SpectrumEmulator.from_sweep(path, test_fraction=0.2)
+    assert set(emulator.accuracy) == {'clTT', 'clTE'}
+    assert all(v['max_fractional_error'] < 1e-3 for v in emulator.accuracy.values())
+
+    emulator.update_val('InitPower.r', 0.042)
+    emulator.update_val('Alens', 1.03)
+    out = emulator.get_cls()
+    assert np.array_equal(out['l'], l)
+    for k, v in spectra(0.042, 1.03).items():
+        assert np.allclose(out[k], v, rtol=1e-3, atol=1e-6)
+    emulator.get_cls(save_to_dict='run')
+    assert emulator.result_parameters['run'] == {'InitPower.r': 0.042, 'Alens': 1.03}
+    with pytest.raises(ValueError):
+        emulator.update_val('H0', 70.)
@@ -0,0 +1,39 @@
+"""
+tests flatsky.py
+"""
+
+import numpy as np
+from deepcmbsim.flatsky import FlatSkyGenerator, synfast_flat, _geometry
+from deepcmbsim.cl_plotting import flatmap
+
+
+def test_flatsky_statistics():
+    pixels, lx_rad = 64, 10 * np.pi / 180
+    l = np.arange(3001)
+    tt = 1e-3 / (l + 10.) ** 2
+    ee, te = 0.3 * tt, 0.3 * tt
+    generator = FlatSkyGenerator(pixels, pixels, lx_rad, lx_rad, [tt, te, 0 * tt, ee, 0 * tt, 0 * tt], [0, 2])
+    maps = generator.draw(400, seed=0)
+    assert maps.shape == (400, 3, pixels, pixels)
+    assert np.array_equal(generator.draw(2, seed=1), generator.draw(2, seed=1))
+
+    # recover E and B from Q and U, and compare the measured power with the input around l=300
+    ell_unique, ell_index, cos_2phi, sin_2phi, pixel_area = _geometry(pixels, pixels, lx_rad, lx_rad)
+    t_k, q_k, u_k = (np.fft.rfft2(maps[:, i]) for i in range(3))
+    e_k, b_k = q_k * cos_2phi + u_k * sin_2phi, -q_k * sin_2phi + u_k * cos_2phi
+    power = lambda a, b: ((a * np.conj(b)).real * pixel_area / pixels ** 2).mean(axis=0)
+    ell = ell_unique[ell_index]
+    modes = (ell > 200) & (ell < 500)
+    for measured, cl in [(power(t_k, t_k), tt), (power(e_k, e_k), ee), (power(t_k, e_k), te)]:
+        assert np.isclose(measured[modes].mean() / np.interp(ell[modes], l, cl).mean(), 1, atol=0.05)
+    assert power(b_k, b_k)[modes].mean() < 1e-10 * np.interp(ell[modes], l, ee).mean()
+
+    assert synfast_flat(pixels, pixels, lx_rad, lx_rad, [tt], [0], seed=3).shape == (1, pixels, pixels)
+
+
+def test_flatmap_backend():
+    cl_dict = {k: np.random.rand(3001) for k in ['clTT', 'clEE', 'clBB', 'clTE']}
+    fm = flatmap(32, 5, cl_dict=cl_dict)
+    assert fm.flatmap('TQU', namaster_seed=1).shape == (3, 32, 32)
+    maps = fm.flatmaps('TQU', n_realizations=3, seed=0)
+    assert maps.shape == (3, 3, 32, 32) and np.array_equal(maps, fm.flatmaps('TQU', n_realizations=3, seed=0))
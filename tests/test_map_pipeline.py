@@ -0,0 +1,28 @@
+"""
+tests map_pipeline.py
+"""
+
+import h5py
+import numpy as np
+from deepcmbsim.sweep_io import SweepWriter
+from deepcmbsim.map_pipeline import write_map_dataset
+
+
+def test_write_map_dataset(tmp_path):
+    sweep_path, maps_path = str(tmp_path / "sweep.h5"), str(tmp_path / "maps.h5")
+    l = np.arange(3001)
+    with SweepWriter(sweep_path, ['InitPower.r'], mode='w') as writer:
+        for i in range(5):
+            writer.append(f'run{i}', {'l': l, **{k: (i + 1) * 1e-3 / (l + 10.) ** 2 for k in ['clTT', 'clEE', 'clBB', 'clTE']}},
+                          {'InitPower.r': 0.01 * i})
+    write_map_dataset(sweep_path, maps_path, 'TQU', 32, 5, realizations_per_run=2, batch_size=2, seed=0)
+    with h5py.File(maps_path, 'r') as f:
+        assert f['maps'].shape == (10, 3, 32, 32) and f['maps'].compression == 'gzip'
+        assert np.allclose(f['parameters']['InitPower.r'], np.repeat(0.01 * np.arange(5), 2))
+        assert list(f['run_id'].asstr()[:4]) == ['run0', 'run0', 'run1', 'run1']
+        assert np.array_equal(f['realization'][()], np.tile([0, 1], 5))
+        assert np.all(np.std(f['maps'][()], axis=(2, 3)) > 0)
+        first = f['maps'][()]
+    write_map_dataset(sweep_path, maps_path, 'TQU', 32, 5, realizations_per_run=2, batch_size=2, seed=0)
+    with h5py.File(maps_path, 'r') as f:
+        assert np.array_equal(f['maps'][()], first)
@@ -22,4 +22,18 @@ def test_detector_white_noise():
     out = (noise_uK_arcmin * arcmin_to_rad)**2 * np.exp( ell * (ell + 1) * (fwhm_arcmin * arcmin_to_rad)**2 / (8 * np.log(2)) )
     final_wn_10_1_1e4 = deepcmbsim.noise.detector_white_noise(noise_uK_arcmin, fwhm_arcmin, ell, TT=True, units_uK = True)[-1]
     assert final_wn_10_1_1e4 == approx(out)
+    noise = deepcmbsim.noise.detector_white_noise(noise_uK_arcmin, fwhm_arcmin, ell)
+    noise *= 2  # the result is the caller's own array, so this leaves the cached noise unchanged
+    assert deepcmbsim.noise.detector_white_noise(noise_uK_arcmin, fwhm_arcmin, ell)[-1] == approx(out)
 
+
+def test_detector_white_noise_batch():
+    noise_uK_arcmin, fwhm_arcmin = np.array([1., 5., 10.]), np.array([1., 2., 3.])
+    batch = deepcmbsim.noise.detector_white_noise_batch(noise_uK_arcmin, fwhm_arcmin, 3000)
+    assert batch.shape == (3, 2, 3001)
+    for i in range(3):
+        for j, TT in enumerate([True, False]):
+            single = deepcmbsim.noise.detector_white_noise(noise_uK_arcmin[i], fwhm_arcmin[i], 3000, TT=TT)
+            assert np.allclose(batch[i, j], single, rtol=1e-12)
+    assert deepcmbsim.noise.detector_white_noise_batch(noise_uK_arcmin, fwhm_arcmin, 3000) is batch
+    assert deepcmbsim.noise.detector_white_noise_batch(5., fwhm_arcmin, 3000).shape == (3, 2, 3001)
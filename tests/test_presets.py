@@ -0,0 +1,29 @@
+"""
+tests presets.py
+"""
+
+import pytest
+from deepcmbsim.params_io import config_obj
+from deepcmbsim.camb_power_spectrum import CAMBPowerSpectrum
+from deepcmbsim.presets import fractional_errors, preset_settings
+
+
+def test_preset_applied():
+    co = config_obj(accuracy_preset="fast-training")
+    co.update_val("verbose", False)
+    co.update_val("max_l_use", 1000)
+    ps = CAMBPowerSpectrum(co)
+    settings = preset_settings("fast-training", 1000)
+    assert ps.max_l_calc == ps.CAMBparams.max_l == 1000 + settings['extra_l']
+    assert ps.CAMBparams.max_eta_k == settings['max_eta_k'] < config_obj().CAMBparams.max_eta_k
+    assert ps.CAMBparams.Accuracy.AccuracyBoost == settings['Accuracy']['AccuracyBoost']
+    assert preset_settings("high-precision", 1000)['Accuracy']['lAccuracyBoost'] > 1
+    with pytest.raises(ValueError):
+        preset_settings("fastest", 1000)
+
+
+def test_fractional_errors():
+    reference = {'l': [0, 1, 2, 3], 'clTT': [0., 0., 2., 4.], 'clEE': [0., 0., 2., 1.], 'clTE': [0., 0., 0., -1.]}
+    cls = {'l': [0, 1, 2, 3], 'clTT': [1., 1., 2., 5.], 'clEE': [0., 0., 2., 1.], 'clTE': [0., 0., 0.2, -1.]}
+    errors = fractional_errors(cls, reference)
+    assert errors['clTT'] == 0.25 and errors['clEE'] == 0. and abs(errors['clTE'] - 0.1) < 1e-12
@@ -0,0 +1,28 @@
+"""
+tests sampling.py
+"""
+
+import numpy as np
+from deepcmbsim.sampling import sample_points
+from deepcmbsim.camb_power_spectrum import _grid_points
+
+
+def test_sample_points():
+    iterables = {"InitPower.r": np.linspace(0.01, 0.1, 3), "Alens": np.array([0.8, 1.2])}
+    for design in ['latin_hypercube', 'sobol', 'random']:
+        points = sample_points(iterables, design, 16, seed=1)
+        assert points.shape == (16, 2)
+        assert np.all(points >= [0.01, 0.8]) and np.all(points <= [0.1, 1.2])
+        assert np.array_equal(points, sample_points(iterables, design, 16, seed=1))
+    lhs = sample_points(iterables, 'latin_hypercube', 16, seed=1)
+    strata = np.floor((lhs - [0.01, 0.8]) / [0.09, 0.4] * 16)
+    assert all(sorted(strata[:, i]) == list(range(16)) for i in range(2))
+
+
+def test_sampled_grid_sharding():
+    iterables = {"InitPower.r": np.linspace(0.01, 0.1, 5), "Alens": np.array([0.8, 1.0, 1.2])}
+    sampler = {'design': 'latin_hypercube', 'n_points': 10, 'seed': 0}
+    shards = [list(_grid_points(iterables, shard_index=i, shard_count=3, sampler=sampler)) for i in range(3)]
+    points = dict(point for shard in shards for point in shard)
+    assert sorted(points.keys()) == list(range(10))
+    assert np.allclose([points[i] for i in range(10)], sample_points(iterables, 'latin_hypercube', 10, seed=0))
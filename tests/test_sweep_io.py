@@ -0,0 +1,193 @@
+"""
+tests sweep_io.py
+"""
+
+import os
+import subprocess
+import sys
+import h5py
+import numpy as np
+import pytest
+from deepcmbsim.camb_power_spectrum import CAMBPowerSpectrum
+from deepcmbsim.sweep_io import BackgroundWriter, merge_shards, read_run, SweepWriter, SweepDataset, to_contiguous
+
+
+# computes one shard of a small grid in its own process, and saves it with savecls (shard 0) or to a sweep file
+_SHARD_SCRIPT = """
+import sys
+import numpy as np
+sys.path.insert(0, sys.argv[3])
+from conftest import small_config_obj
+from deepcmbsim.camb_power_spectrum import CAMBPowerSpectrum
+shard_index, shard_output = int(sys.argv[1]), sys.argv[2]
+co = small_config_obj(shard_index=shard_index, shard_count=2)
+co.update_val("ITERABLES", {"InitPower.r": np.array([0.01, 0.1, 0.2])}, verbose=False)
+ps = CAMBPowerSpectrum(co)
+if shard_index == 0:
+    ps.loop_sims()
+    ps.savecls(savedir=shard_output)
+else:
+    ps.loop_sims(outfile=shard_output)
+"""
+
+
+def test_merge_shards(tmp_path):
+    shard_outputs = [str(tmp_path / "shard0"), str(tmp_path / "shard1.h5")]
+    jobs = [subprocess.Popen([sys.executable, '-c', _SHARD_SCRIPT, str(i), shard_output, os.path.dirname(__file__)])
+            for i, shard_output in enumerate(shard_outputs)]
+    assert [job.wait() for job in jobs] == [0, 0]
+    merge_shards(shard_outputs, str(tmp_path / "merged.h5"))
+    with h5py.File(tmp_path / "merged.h5", 'r') as f:
+        assert list(f['grid_index'][()]) == [0, 1, 2]
+        assert np.allclose(f['parameters']['InitPower.r'], [0.01, 0.1, 0.2])
+        assert f['clTT'].shape == (3, 201)
+
+
+def test_sweep_writer_append(tmp_path):
+    path = str(tmp_path / "sweep.h5")
+    run = {'l': range(11), 'clTT': np.random.rand(11), 'clBB': np.random.rand(11)}
+    with SweepWriter(path, ['InitPower.r', 'Alens'], mode='w') as writer:
+        writer.append('run0', run, {'InitPower.r': 0.1, 'Alens': 1.0})
+    with SweepWriter(path, ['InitPower.r', 'Alens']) as writer:
+        writer.append('run1', run, {'InitPower.r': 0.2, 'Alens': 0.8}, grid_index=1)
+        assert len(writer) == 2
+    with h5py.File(path, 'r') as f:
+        assert f['clBB'].shape == (2, 11) and f['l'].shape == (11,)
+        assert list(f['parameters']['Alens']) == [1.0, 0.8]
+        assert list(f['run_id'].asstr()) == ['run0', 'run1']
+    with pytest.raises(ValueError) as excinfo:  # whose traceback keeps the writer alive
+        SweepWriter(path, ['Alens'])
+    assert excinfo.value is not None and h5py.h5f.get_obj_count(types=h5py.h5f.OBJ_FILE) == 0
+
+
+def test_sweep_dataset(tmp_path):
+    path, contiguous_path = str(tmp_path / "sweep.h5"), str(tmp_path / "contiguous.h5")
+    runs = [{'l': range(11), 'clTT': np.random.rand(11), 'clEE': np.random.rand(11)} for _ in range(10)]
+    with SweepWriter(path, ['InitPower.r'], mode='w') as writer:
+        for i, run in enumerate(runs):
+            writer.append(f'run{i}', run, {'InitPower.r': i})
+    to_contiguous(path, contiguous_path)
+    for p, memory_mapped in [(path, False), (contiguous_path, True)]:
+        with SweepDataset(p) as ds:
+            assert ds.memory_mapped == memory_mapped and len(ds) == 10
+            params, _ = ds[3:6]  # read from the file, without holding every row in memory
+            assert list(params[:, 0]) == [3, 4, 5] and list(ds.run_ids(slice(3, 5))) == ['run3', 'run4']
+            assert 'params' not in ds.__dict__ and 'run_id' not in ds.__dict__
+            params, cls = ds[[7, 2, 7]]
+            assert list(params[:, 0]) == [7, 2, 7] and cls.shape == (3, 2, 11)
+            assert np.array_equal(cls[1, 1], runs[2]['clEE'])
+            seen = np.concatenate([batch_params[:, 0] for batch_params, _ in ds.iter_batches(3, seed=0)])
+            assert sorted(seen) == list(range(10))
+
+
+def test_save_sweep_binned(tmp_path, small_config):
+    co = small_config
+    co.update_val("max_l_use", 100)
+    ps = CAMBPowerSpectrum(co)
+    # BINNING set after the CAMBPowerSpectrum is made is still used
+    ps.update_val("BINNING", {'scheme': 'linear', 'n_bins': 5, 'l_min': 2})
+    for i in range(3):
+        ps.results[f'run{i}'] = {'l': range(101), 'clTT': np.full(101, float(i)), 'clEE': np.arange(101.)}
+        ps.result_parameters[f'run{i}'], ps.swept_params[f'run{i}'] = {}, {'InitPower.r': i, 'Alens': 1.}
+        ps.loop_runids.append(f'run{i}')
+    ps.save_sweep(str(tmp_path / "binned.h5"))
+    with SweepDataset(str(tmp_path / "binned.h5")) as ds:
+        params, cls = ds[[0, 1, 2]]
+        assert cls.shape == (3, 2, 5) and np.allclose(ds.l, ps.binning.l_eff)
+        assert np.allclose(cls[:, 0, 2], [0., 1., 2.]) and np.allclose(cls[0, 1], ps.binning.l_eff)
+
+
+def test_loop_sims_binning_updated(tmp_path, small_config):
+    co = small_config
+    for k, v in [("max_l_use", 100), ("ITERABLES", {"InitPower.r": np.array([0.01])})]:
+        co.update_val(k, v)
+    ps = CAMBPowerSpectrum(co)
+    ps.update_val("BINNING", {'scheme': 'linear', 'n_bins': 5, 'l_min': 2})
+    ps.loop_sims(outfile=str(tmp_path / "sweep.h5"))
+    with SweepDataset(str(tmp_path / "sweep.h5")) as ds:
+        assert ds.binning is not None and ds[0][1].shape[-1] == 5
+
+
+def test_storage_options(tmp_path, small_config):
+    co = small_config
+    co.update_val("max_l_use", 100)
+    co.update_val("STORAGE", {'dtype': 'f4', 'compression': 'gzip', 'shuffle': True, 'shared_l': True})
+    ps = CAMBPowerSpectrum(co)
+    ps.get_cls(save_to_dict='run0')
+    ps.get_cls(save_to_dict='run1')
+    ps.loop_runids = ['run0', 'run1']
+    ps.savecls(savedir=str(tmp_path / "runs"))
+    results, _, _, _ = read_run(str(tmp_path / "runs"), 'run1')
+    assert np.array_equal(results['l'], ps.results['run1']['l']) and results['clTT'].dtype == np.float32
+    assert np.allclose(results['clTT'], ps.results['run1']['clTT'], rtol=1e-6)
+    with h5py.File(tmp_path / "runs" / "multipoles.h5", 'r') as f:
+        assert len(f) == 1
+    ps.save_sweep(str(tmp_path / "sweep.h5"))
+    with SweepDataset(str(tmp_path / "sweep.h5")) as ds:
+        assert ds._file['clTT'].compression == 'gzip' and ds[0][1].dtype == np.float32
+    with pytest.raises(ValueError):
+        SweepWriter(str(tmp_path / "f2.h5"), [], mode='w', storage={'dtype': 'f2'}).append('run0', ps.results['run0'], {})
+
+
+def test_loop_sims_background_writer(tmp_path, small_config):
+    co = small_config
+    for k, v in [("max_l_use", 100), ("writer_queue_size", 1),
+                 ("ITERABLES", {"InitPower.r": np.array([0.01, 0.1, 0.2])})]:
+        co.update_val(k, v)
+    ps = CAMBPowerSpectrum(co)
+    ps.loop_sims(outfile=str(tmp_path / "sweep.h5"), checkpoint_dir=str(tmp_path / "runs"), keep_results=False)
+    assert ps.results == {} and ps.result_parameters == {} and ps.loop_runids == []
+    assert ps.grid_indices == {} and ps.swept_params == {} and ps.timer.records == {}
+    assert ps.timer.summary()['total']['count'] == 3
+    with SweepDataset(str(tmp_path / "sweep.h5")) as ds:
+        assert len(ds) == 3 and np.allclose(ds.params[:, 0], [0.01, 0.1, 0.2])
+        results, _, _, _ = read_run(str(tmp_path / "runs"), ds.run_id[2])
+        assert np.array_equal(ds[2][1][ds.spectra.index('clBB')], results['clBB'])
+    with pytest.raises(ValueError):
+        ps.loop_sims(keep_results=False)
+
+
+def test_loop_sims_interrupted_resume(tmp_path, small_config, monkeypatch):
+    co = small_config
+    for k, v in [("max_l_use", 100), ("ITERABLES", {"InitPower.r": np.array([0.01, 0.1, 0.2])})]:
+        co.update_val(k, v)
+    ps = CAMBPowerSpectrum(co)
+    outfile, checkpoint_dir = str(tmp_path / "sweep.h5"), str(tmp_path / "runs")
+    # interrupt the third point before any buffered rows have been written to outfile
+    get_cls, calls = CAMBPowerSpectrum.get_cls, []
+
+    def interrupted_get_cls(self, *args, **kwargs):
+        calls.append(None)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return get_cls(self, *args, **kwargs)
+
+    monkeypatch.setattr(CAMBPowerSpectrum, "get_cls", interrupted_get_cls)
+    monkeypatch.setattr(SweepWriter, "_write_pending", lambda self: None)
+    with pytest.raises(KeyboardInterrupt):
+        ps.loop_sims(outfile=outfile, checkpoint_dir=checkpoint_dir, keep_results=False)
+    monkeypatch.undo()
+    assert len([f for f in os.listdir(checkpoint_dir) if f.endswith("_results.h5")]) == 2
+    ps.loop_sims(outfile=outfile, checkpoint_dir=checkpoint_dir, resume=True, keep_results=False)
+    with SweepDataset(outfile) as ds:
+        assert len(ds) == 3 and len(set(ds.run_id)) == 3
+        assert np.allclose(np.sort(ds.params[:, 0]), [0.01, 0.1, 0.2])
+        for i, run_id in enumerate(ds.run_id):
+            results, _, _, _ = read_run(checkpoint_dir, run_id)
+            assert np.array_equal(ds[i][1][ds.spectra.index('clBB')], results['clBB'])
+
+
+def test_background_writer_raises():
+    written = []
+
+    def write(item):
+        if item == 2:
+            raise OSError("disk full")
+        written.append(item)
+
+    writer = BackgroundWriter(write, queue_size=1)
+    with pytest.raises(OSError):
+        for i in range(100):
+            writer.put(i)
+        writer.close()
+    assert written == [0, 1]
@@ -2,7 +2,9 @@
 tests yam_io.py
 """
 
-from deepcmbsim.params_io import config_obj
+import subprocess
+import sys
+from deepcmbsim.params_io import config_obj, _camb_params_to_dict, camb_params_from_dict
 
 
 def test_update_val():
@@ -10,3 +12,26 @@ def test_update_val():
     co.update_val("Alens", 10)
     co.update_val("InitPower.r", 10)
     assert [co.CAMBparams.Alens, co.CAMBparams.InitPower.r] == [10, 10]
+
+
+def test_camb_params_dict_roundtrip():
+    co = config_obj()
+    co.update_val("InitPower.r", 0.3)
+    co.update_val("InitPower.ns", 0.9)
+    cpd = co.camb_params_to_dict(user_params=False)
+    assert _camb_params_to_dict(camb_params_from_dict(cpd)) == cpd
+    assert co.camb_params_to_dict(user_params=True)['FORCAMB'] == {'InitPower': {'ns': 0.9, 'r': 0.3}}
+
+
+def test_config_obj_instances_independent():
+    co = config_obj()
+    co.update_val("InitPower.r", 0.3, verbose=False)
+    co.UserParams['max_l_use'] = 1
+    co2 = config_obj()
+    assert co2.CAMBparams.InitPower.r != 0.3 and co2.UserParams['max_l_use'] != 1
+    assert _camb_params_to_dict(co2.CAMBparams) == _camb_params_to_dict(config_obj().CAMBparams)
+
+
+def test_import_does_not_load_camb():
+    statement = "import sys, deepcmbsim, deepcmbsim.sweep_io; assert 'camb' not in sys.modules; deepcmbsim.config_obj"
+    subprocess.run([sys.executable, '-c', statement], check=True)